@@ -0,0 +1,117 @@
+from collections import OrderedDict
+
+import chess
+import pygame
+
+FONT_FILE = 'freesansbold.ttf'
+LIGHT_SQUARE = '#ffcf9f'
+DARK_SQUARE = '#d28c45'
+PIECE_SIZE = 50
+SMALL_PIECE_SIZE = 30
+
+
+# fonts, rendered text, images and the board background of one window
+# everything here belongs to the running pygame instance, make a new one after pygame.quit()
+class RenderAssets:
+    def __init__(self, max_texts=256):
+        self.max_texts = max_texts
+        self.fonts = {}
+        self.texts = OrderedDict()
+        self.images = {}
+        self.boards = {}
+        # ---------------------------------------
+        self.text_hits = 0
+        self.text_misses = 0
+
+    def font(self, size: int):
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(FONT_FILE, size)
+            self.fonts[size] = font
+        return font
+
+    # rendered text, the clocks change every second so only the most recent surfaces are kept
+    def text(self, text: str, size: int, color):
+        key = (text, size, color)
+        surface = self.texts.get(key)
+        if surface is not None:
+            self.texts.move_to_end(key)
+            self.text_hits += 1
+            return surface
+
+        self.text_misses += 1
+        surface = self.font(size).render(text, True, color)
+        self.texts[key] = surface
+        if len(self.texts) > self.max_texts:
+            self.texts.popitem(last=False)
+        return surface
+
+    def image(self, path: str):
+        image = self.images.get(path)
+        if image is None:
+            image = pygame.image.load(path)
+            self.images[path] = image
+        return image
+
+    # copy of an image for a disabled button
+    def faded_image(self, path: str, faded_color=(128, 128, 128, 128)):
+        key = (path, faded_color)
+        image = self.images.get(key)
+        if image is None:
+            image = self.image(path).copy()
+            image.fill(faded_color, special_flags=pygame.BLEND_RGBA_MULT)
+            self.images[key] = image
+        return image
+
+    # empty checkerboard with its grid lines, squares are restored by blitting from it
+    def board(self, title_size: int):
+        board = self.boards.get(title_size)
+        if board is None:
+            board = pygame.Surface((title_size * 8, title_size * 8))
+            for row in range(8):
+                for col in range(8):
+                    rect = pygame.Rect(col * title_size, row * title_size, title_size, title_size)
+                    pygame.draw.rect(board, LIGHT_SQUARE if (col + row) % 2 == 0 else DARK_SQUARE, rect)
+                    pygame.draw.line(board, 'black', rect.topleft, (rect.right - 1, rect.top), 1)
+                    pygame.draw.line(board, 'black', rect.topleft, (rect.left, rect.bottom - 1), 1)
+            self.boards[title_size] = board
+        return board
+
+
+# all twelve piece images of one size on a single sheet, looked up by (piece_type, color)
+class PieceAtlas:
+    def __init__(self, size: int):
+        self.size = size
+        self.cells = {}
+        sheet = pygame.Surface((size * len(chess.PIECE_TYPES), size * 2), pygame.SRCALPHA)
+        for row, color in enumerate(chess.COLORS):
+            for col, piece_type in enumerate(chess.PIECE_TYPES):
+                image = pygame.image.load(f'img/{chess.COLOR_NAMES[color]}-{chess.piece_name(piece_type)}.png')
+                if image.get_size() != (size, size):
+                    image = pygame.transform.scale(image, (size, size))
+                cell = pygame.Rect(col * size, row * size, size, size)
+                # copy the pixels as they are, a normal blit would blend them with the empty sheet
+                sheet.blit(image, cell, special_flags=pygame.BLEND_RGBA_MAX)
+                self.cells[piece_type, color] = cell
+        # same pixel format as the screen makes every blit a plain copy, needs the display mode set
+        self.sheet = sheet.convert_alpha() if pygame.display.get_surface() is not None else sheet
+
+    def blit(self, surface: pygame.Surface, piece: chess.Piece, position):
+        surface.blit(self.sheet, position, self.cells[piece.piece_type, piece.color])
+
+    # draw a whole position with one call, placements are (piece, position) pairs
+    def blits(self, surface: pygame.Surface, placements):
+        surface.blits([(self.sheet, position, self.cells[piece.piece_type, piece.color])
+                       for piece, position in placements], doreturn=False)
+
+
+atlases = {}
+
+
+# atlases are loaded once per process and shared by every game window
+def piece_atlas(size: int):
+    atlas = atlases.get(size)
+    if atlas is None:
+        atlas = PieceAtlas(size)
+        atlases[size] = atlas
+    return atlas
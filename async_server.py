@@ -0,0 +1,199 @@
+import asyncio
+import socket
+import time
+
+import protocol
+import scheduler
+from framing import MAX_PENDING_BYTES
+from replay_store import encode_record
+from server import REPLAY_CHUNK_PLIES, Server, parse_args, time_control
+from utility import Message
+
+
+# same protocol and game logic as Server, but every client is served by a coroutine
+# on one event loop instead of a dedicated OS thread
+class AsyncServer(Server):
+    def __init__(self, ip='127.0.0.1', port=5555, time_control=scheduler.DEFAULT_TIME_CONTROL):
+        super().__init__(ip, port, time_control)
+        self.loop = None
+
+    # connections are asyncio.StreamWriter objects, write() only buffers so it never blocks the loop
+    # a peer that lets more than MAX_PENDING_BYTES pile up is dropped, its reader then sees the end of the stream
+    def send_payload(self, con: asyncio.StreamWriter, payload: bytes):
+        try:
+            if con.is_closing():
+                return False
+            pending = con.transport.get_write_buffer_size()
+            if pending + len(payload) > MAX_PENDING_BYTES:
+                con.transport.abort()
+                raise ConnectionError(f'Peer fell {pending} bytes behind, connection dropped')
+            con.write(len(payload).to_bytes(self.header_length, byteorder='big') + payload)
+            return True
+        except Exception as er:
+            self.logger.error(str(er))
+            return False
+
+    # flag-fall arrives on the scheduler thread, hand it over to the event loop
+    def on_time_out(self, game_id: int, kind: str):
+        self.loop.call_soon_threadsafe(self.handle_time_out, game_id, kind)
+
+    def on_clock_sync(self, game_id: int):
+        self.loop.call_soon_threadsafe(self.send_clock_sync, game_id)
+
+    # no thread waits on the queue here, so pairs are taken until none is left, which also matches
+    # a player that create_game queued again because the opponent had left
+    def match_players(self, pairs: list[tuple]):
+        while pairs:
+            super().match_players(pairs)
+            pairs = self.player_queue.pop_pairs(block=False)
+
+    # the game is encoded on the loop while it is locked, the segment append and the catalogue insert
+    # run on the executor
+    def save_game_replay(self, game_id: int):
+        record = encode_record(int(time.time()), self.games[game_id])
+        self.loop.run_in_executor(None, self.save_record, record).add_done_callback(self.replay_saved)
+
+    def replay_saved(self, future: asyncio.Future):
+        if future.exception() is not None:
+            self.logger.error(str(future.exception()))
+
+    async def receive_async(self, reader: asyncio.StreamReader):
+        try:
+            receive_length = int.from_bytes(await reader.readexactly(self.header_length), byteorder='big')
+            receive_data = protocol.loads(await reader.readexactly(receive_length))
+            return receive_data
+        except asyncio.IncompleteReadError:
+            return None
+        except Exception as er:
+            self.logger.error(er)
+
+    async def client_play_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, player_id: int):
+        while True:
+            try:
+                receive_data = await self.receive_async(reader)
+                if receive_data is None:
+                    break
+                self.handle_player_data(player_id, receive_data)
+                await writer.drain()
+            except Exception as er:
+                self.logger.error(str(er))
+                break
+
+        self.disconnect_player(player_id)
+        writer.close()
+
+    async def client_view_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, viewer_id: int):
+        selection = Message.NO_SELECTION
+        while True:
+            try:
+                if selection == Message.NO_SELECTION:
+                    message = await self.receive_async(reader)
+                    if message is None:
+                        break
+                    if message == Message.ALL_DATA:
+                        self.send(writer, self.get_active_games())
+                    elif message == Message.METRICS:
+                        self.send(writer, self.get_metrics())
+                    elif isinstance(message, dict):
+                        self.send(writer, self.get_room_changes(message))
+                    else:
+                        selection = message
+                else:
+                    # updates are pushed until the viewer stops viewing or leaves
+                    self.add_subscriber(selection, writer)
+                    await self.receive_async(reader)
+                    self.remove_subscriber(selection, writer)
+                    selection = Message.NO_SELECTION
+                    break
+            except Exception as er:
+                self.logger.error(str(er))
+                break
+
+        self.logger.info(f'Viewer {viewer_id} disconnected')
+        writer.close()
+
+    async def client_replay_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, replay_id: int):
+        selection = Message.NO_SELECTION
+        while True:
+            try:
+                if selection == Message.NO_SELECTION:
+                    message = await self.receive_async(reader)
+                    if message is None:
+                        break
+                    if message == Message.ALL_DATA:
+                        self.send(writer, self.get_all_games())
+                    elif isinstance(message, dict) and 'replay' in message:
+                        await self.stream_game_replay_async(writer, message)
+                    elif isinstance(message, dict):
+                        self.send(writer, self.get_replay_page(message))
+                    else:
+                        selection = message
+                else:
+                    # file access is blocking, keep it off the event loop
+                    send_data = await self.loop.run_in_executor(None, self.load_game_replay, selection)
+                    self.send(writer, send_data)
+                    await writer.drain()
+                    selection = Message.NO_SELECTION
+            except Exception as er:
+                self.logger.error(str(er))
+                break
+
+        self.logger.info(f'Replay {replay_id} disconnected')
+        writer.close()
+
+    # same as Server.stream_game_replay, waits for every chunk to drain before reading the next one
+    async def stream_game_replay_async(self, writer: asyncio.StreamWriter, request: dict):
+        header = await self.loop.run_in_executor(None, self.get_replay_header, request)
+        self.send(writer, header)
+        for start in range(header['start'], header['end'], REPLAY_CHUNK_PLIES):
+            end = min(header['end'], start + REPLAY_CHUNK_PLIES)
+            payload = await self.loop.run_in_executor(None, self.get_replay_chunk, header['name'], start, end)
+            self.send_payload(writer, payload)
+            await writer.drain()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # asyncio only turns Nagle off for sockets made with IPPROTO_TCP, not for the accepted ones of our socket
+        sock = writer.get_extra_info('socket')
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+        action = await self.receive_async(reader)
+
+        # for play client
+        if action == Message.PLAY:
+            client_id = self.add_player(writer)
+            self.match_players(self.player_queue.pop_pairs(block=False))
+            await self.client_play_async(reader, writer, client_id)
+
+        # for view client
+        elif action == Message.VIEW:
+            client_id = self.add_viewer(writer)
+            await self.client_view_async(reader, writer, client_id)
+
+        # for replay client
+        elif action is not None:
+            client_id = self.add_replay(writer)
+            await self.client_replay_async(reader, writer, client_id)
+
+        else:
+            writer.close()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.clock_scheduler.start()
+        self.server_socket.setblocking(False)
+        server = await asyncio.start_server(self.handle_connection, sock=self.server_socket,
+                                            backlog=socket.SOMAXCONN)
+        self.logger.info("Waiting for connection, async server started")
+        async with server:
+            await server.serve_forever()
+
+    def start(self):
+        asyncio.run(self.serve())
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server = AsyncServer(args.ip, args.port, time_control(args))
+    server.start()
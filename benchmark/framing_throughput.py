@@ -0,0 +1,92 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from framing import Connection  # noqa: E402
+
+HEADER_LENGTH = 4
+
+
+# receive path before the framing layer: one recv for the header, one recv for the payload
+class LegacyReceiver:
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+
+    def receive_frame(self):
+        length = int.from_bytes(self.socket.recv(HEADER_LENGTH), byteorder='big')
+        return self.socket.recv(length)
+
+
+def writer(sock: socket.socket, payload: bytes, frames: int):
+    frame = len(payload).to_bytes(HEADER_LENGTH, byteorder='big') + payload
+    try:
+        for _ in range(frames):
+            sock.sendall(frame)
+    except OSError:
+        # the receiver gave up on a desynchronised stream
+        pass
+
+
+def run_receiver(receiver, size: int, frames: int, trace: bool):
+    broken = 0
+    allocated = 0
+    for _ in range(frames):
+        if trace:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        payload = receiver.receive_frame()
+        if trace:
+            allocated += tracemalloc.get_traced_memory()[1] - before
+        if payload is None or len(payload) != size:
+            # a short read leaves the rest of the payload in the stream, nothing after it can be trusted
+            broken += 1
+            break
+    return broken, allocated
+
+
+def measure(name: str, make_receiver, size: int, frames: int, trace: bool):
+    left, right = socket.socketpair()
+    receiver = make_receiver(right)
+    payload = os.urandom(size)
+    thread = threading.Thread(target=writer, args=(left, payload, frames), daemon=True)
+
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    thread.start()
+    broken, allocated = run_receiver(receiver, size, frames, trace)
+    elapsed = time.perf_counter() - start
+    if trace:
+        tracemalloc.stop()
+
+    left.close()
+    right.close()
+    thread.join(1)
+    return elapsed, broken, allocated
+
+
+def main(frames: int, sizes: list[int]):
+    receivers = [('legacy recv', LegacyReceiver), ('recv_into', Connection)]
+    for size in sizes:
+        for name, make_receiver in receivers:
+            elapsed, broken, _ = measure(name, make_receiver, size, frames, trace=False)
+            _, _, allocated = measure(name, make_receiver, size, min(frames, 500), trace=True)
+            if broken:
+                print(f'{size:>8} B | {name:<12} | stream desynchronised (short read)')
+                continue
+            throughput = size * frames / elapsed / 1024 / 1024
+            print(f'{size:>8} B | {name:<12} | {throughput:9.1f} MB/s | '
+                  f'{allocated / min(frames, 500):10.1f} B allocated per frame')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Receive throughput and allocations of the framing layer')
+    parser.add_argument('--frames', type=int, default=5000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 4096, 65536, 1048576])
+    args = parser.parse_args()
+    main(args.frames, args.sizes)
@@ -0,0 +1,85 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import protocol  # noqa: E402
+from server import Server  # noqa: E402
+from utility import memory_usage  # noqa: E402
+
+
+class NullConnection:
+    def send_frame(self, payload: bytes):
+        pass
+
+    def close(self):
+        pass
+
+
+# one random game of up to plies plies between two new players, both leave at the end
+def play_game(server: Server, rng: random.Random, plies: int):
+    players = [server.add_player(NullConnection()), server.add_player(NullConnection())]
+    server.match_players(server.player_queue.pop_pairs(block=False))
+    game = server.games[server.connecting_players[players[0]]['game_id']]
+    for _ in range(plies):
+        board = game['board']
+        legal_moves = list(board.legal_moves)
+        if game['winner'] or not legal_moves:
+            break
+        player_id = game['white'] if board.turn else game['black']
+        server.handle_player_data(player_id, protocol.MoveMessage(len(board.move_stack), rng.choice(legal_moves), 0))
+    for player_id in players:
+        server.disconnect_player(player_id)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Server memory against the number of games played')
+    parser.add_argument('--games', type=int, default=4000)
+    parser.add_argument('--plies', type=int, default=80)
+    parser.add_argument('--report-every', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=500,
+                        help='games played before the shared caches are full, their growth is not checked')
+    parser.add_argument('--max-kb-per-game', type=float, default=2.0,
+                        help='fail when RSS grows by more than this per game after the warmup')
+    parser.add_argument('--keep-finished', action='store_true', help='never retire finished games, as before')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.TemporaryDirectory()
+    # the server keeps its replays in its working directory
+    os.chdir(directory.name)
+    server = Server('127.0.0.1', 0)
+    server.logger.setLevel(logging.WARNING)
+    if args.keep_finished:
+        server.retire_game = lambda game_id: None
+
+    rng = random.Random(args.seed)
+    start_rss, _ = memory_usage()
+    warm_rss = start_rss
+    # the legal move cache and the recent games are shared by all games and bounded on their own,
+    # they fill up during the warmup, after it a played game must leave nothing behind
+    print(f'{"games played":>14}{"in memory":>12}{"positions":>12}{"RSS MB":>10}')
+    print(f'{0:>14}{0:>12}{0:>12}{start_rss / 1024:>10.1f}')
+    for played in range(1, args.games + 1):
+        play_game(server, rng, args.plies)
+        if played == args.warmup:
+            warm_rss, _ = memory_usage()
+        if played % args.report_every == 0:
+            metrics = server.get_memory_metrics()
+            in_memory = metrics['running_games'] + metrics['recent_games']
+            print(f'{played:>14}{in_memory:>12}{len(server.move_cache.positions):>12}'
+                  f'{metrics["rss_kb"] / 1024:>10.1f}')
+    end_rss, _ = memory_usage()
+    server.replay_store.close()
+    print(f'RSS grew {(end_rss - start_rss) / 1024:.1f} MB, '
+          f'{(end_rss - start_rss) / args.games:.1f} KB per game played')
+    if args.games > args.warmup:
+        steady = (end_rss - warm_rss) / (args.games - args.warmup)
+        print(f'after the warmup of {args.warmup} games: {steady:.2f} KB per game played')
+        if steady > args.max_kb_per_game:
+            print(f'memory is not bounded, more than {args.max_kb_per_game} KB per game')
+            sys.exit(1)
@@ -0,0 +1,437 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import chess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import protocol  # noqa: E402
+from client import Client  # noqa: E402
+from server_load import raise_fd_limit  # noqa: E402
+from utility import Message  # noqa: E402
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+# client.Client that counts the bytes of every frame and counts errors instead of printing them
+class CountingClient(Client):
+    def __init__(self, action: str, server_ip: str, server_port: int):
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = 0
+        super().__init__(action, server_ip, server_port)
+
+    def send(self, data):
+        return self.send_payload(pickle.dumps(data))
+
+    def send_payload(self, payload: bytes):
+        try:
+            self.connection.send_frame(payload)
+            self.bytes_sent += len(payload) + self.header_length
+            return True
+        except Exception:
+            self.errors += 1
+            return False
+
+    def receive(self):
+        try:
+            payload = self.connection.receive_frame()
+            if payload is None:
+                return None
+            self.bytes_received += len(payload) + self.header_length
+            return protocol.loads(payload)
+        except Exception:
+            self.errors += 1
+            return None
+
+    # shutdown wakes up a thread blocked in receive, close alone does not
+    def close(self):
+        try:
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.client_socket.close()
+
+
+# latencies and counters of every bot, shared by all bot threads
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.counters = {}
+        # every open client, closed at the end so no bot stays blocked in receive
+        self.clients = set()
+
+    def add(self, name: str, seconds: float):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def count(self, name: str, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def connect(self, action: str, address: tuple):
+        client = CountingClient(action, *address)
+        if client.client_id is None:
+            self.count('connect_errors')
+            client.close()
+            return None
+        with self.lock:
+            self.clients.add(client)
+        return client
+
+    # counted once, a bot can still close a client that close_all already closed
+    def disconnect(self, client: CountingClient):
+        client.close()
+        with self.lock:
+            if client not in self.clients:
+                return
+            self.clients.discard(client)
+        self.count('bytes_sent', client.bytes_sent)
+        self.count('bytes_received', client.bytes_received)
+        self.count('errors', client.errors)
+
+    def close_all(self):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            self.disconnect(client)
+
+    def merge(self, samples: dict, counters: dict):
+        with self.lock:
+            for name, values in samples.items():
+                self.samples.setdefault(name, []).extend(values)
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self, name: str):
+        with self.lock:
+            samples = sorted(self.samples.get(name, []))
+        if not samples:
+            return None
+        return {
+            'count': len(samples),
+            'p50_ms': statistics.median(samples) * 1000,
+            'p90_ms': samples[int(len(samples) * 0.9) - 1 if len(samples) >= 10 else -1] * 1000,
+            'p99_ms': samples[int(len(samples) * 0.99) - 1 if len(samples) >= 100 else -1] * 1000,
+            'max_ms': samples[-1] * 1000
+        }
+
+
+# queue, play random legal moves until the game ends or max_plies is reached, queue again until the deadline
+# the round trip of a move ends with the clock sync the server sends back to both players after it
+def player_bot(stats: Stats, address: tuple, deadline: float, think: float, max_plies: int, rng: random.Random):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        client = stats.connect(Message.PLAY, address)
+        if client is None:
+            return
+        game = client.receive()
+        if not isinstance(game, dict):
+            stats.disconnect(client)
+            continue
+        stats.add('matchmaking', time.perf_counter() - start)
+        stats.count('games')
+        color = game['white'] == client.client_id
+        board = chess.Board()
+        sent_at = None
+        turn_start = time.perf_counter()
+
+        while True:
+            if board.turn == color:
+                if board.is_game_over() or len(board.move_stack) >= max_plies or time.monotonic() >= deadline:
+                    break
+                time.sleep(rng.uniform(0, think))
+                move = rng.choice(list(board.legal_moves))
+                sent_at = time.perf_counter()
+                elapsed_ms = int((sent_at - turn_start) * 1000)
+                if not client.send_payload(protocol.encode_move(len(board.move_stack), move, elapsed_ms)):
+                    break
+                board.push(move)
+                stats.count('moves')
+
+            message = client.receive()
+            if message is None:
+                break
+            if isinstance(message, protocol.MoveMessage):
+                if message.ply == len(board.move_stack):
+                    board.push(message.move)
+                    turn_start = time.perf_counter()
+            elif isinstance(message, protocol.ClockSync):
+                if sent_at is not None and message.ply == len(board.move_stack):
+                    stats.add('move_round_trip', time.perf_counter() - sent_at)
+                    sent_at = None
+            elif isinstance(message, dict):
+                # opponent left, ran out of time or a move was refused
+                if message['state'] != Message.READY or message['winner'] != '':
+                    break
+                stats.count('resyncs')
+                board = message['board']
+        stats.disconnect(client)
+
+
+# list the running games, watch one of them for a while, stop viewing and do it again
+# the server closes a view connection after STOP_VIEWING, every view is a new connection
+# keeps its room list between two visits like the room browser, and only asks for what changed
+def spectator_bot(stats: Stats, address: tuple, deadline: float, rng: random.Random):
+    rooms = {}
+    version = 0
+    while time.monotonic() < deadline:
+        client = stats.connect(Message.VIEW, address)
+        if client is None:
+            return
+        start = time.perf_counter()
+        client.send({'rooms': version})
+        changes = client.receive()
+        if changes is None:
+            stats.disconnect(client)
+            continue
+        stats.add('room_list', time.perf_counter() - start)
+        if changes['full']:
+            rooms = dict(changes['rooms'])
+        else:
+            rooms.update(changes['rooms'])
+            for game_id in changes['removed']:
+                rooms.pop(game_id, None)
+        version = changes['version']
+        if not rooms:
+            stats.disconnect(client)
+            time.sleep(0.2)
+            continue
+
+        game_id = rng.choice(sorted(rooms))
+        start = time.perf_counter()
+        client.send(game_id)
+        if client.receive() is None:
+            stats.disconnect(client)
+            continue
+        stats.add('view_snapshot', time.perf_counter() - start)
+
+        timer = threading.Timer(rng.uniform(1.0, 3.0), client.send, (Message.STOP_VIEWING,))
+        timer.start()
+        while client.receive() is not None:
+            stats.count('view_updates')
+        timer.cancel()
+        stats.disconnect(client)
+
+
+# browse random pages of played games and stream one of them
+def replay_bot(stats: Stats, address: tuple, deadline: float, rng: random.Random):
+    client = stats.connect(Message.REPLAY, address)
+    if client is None:
+        return
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        if not client.send({'page': rng.randrange(3), 'page_size': 20}):
+            break
+        page = client.receive()
+        if page is None:
+            break
+        stats.add('replay_page', time.perf_counter() - start)
+        if not page['games']:
+            time.sleep(0.2)
+            continue
+
+        start = time.perf_counter()
+        client.send({'replay': rng.choice(page['games'])['name']})
+        header = client.receive()
+        if header is None:
+            break
+        plies = header['end'] - header['start']
+        while plies > 0:
+            chunk = client.receive()
+            if chunk is None:
+                break
+            plies -= len(chunk.moves)
+        stats.add('replay_stream', time.perf_counter() - start)
+    stats.disconnect(client)
+
+
+def start_server(port: int, use_async: bool, directory: str):
+    command = [sys.executable, os.path.join(ROOT, 'server.py'), '--port', str(port)]
+    if use_async:
+        command.append('--async')
+    # the server writes its replays into its working directory
+    process = subprocess.Popen(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1)
+    return process
+
+
+# cpu seconds, RSS and peak RSS (KB) of the process
+def process_usage(pid: int):
+    with open(f'/proc/{pid}/stat') as file:
+        fields = file.read().rsplit(')', 1)[1].split()
+    status = {}
+    with open(f'/proc/{pid}/status') as file:
+        for line in file:
+            key, value = line.split(':', 1)
+            status[key] = value.strip()
+    return {
+        'cpu_s': (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        'rss_kb': int(status['VmRSS'].split()[0]),
+        'peak_rss_kb': int(status['VmHWM'].split()[0])
+    }
+
+
+# bots of one share, the players are split evenly over the processes
+def split(total: int, parts: int, index: int):
+    return total // parts + (1 if index < total % parts else 0)
+
+
+# one thread per bot, runs in a worker process when the bots are spread over several
+def run_bots(args, address: tuple, deadline: float, seed: int, players: int, spectators: int, replay_browsers: int):
+    stats = Stats()
+    # thousands of mostly sleeping bots, a small stack keeps their memory down
+    threading.stack_size(256 * 1024)
+    rng = random.Random(seed)
+    threads = []
+    for _ in range(players):
+        threads.append(threading.Thread(target=player_bot, args=(
+            stats, address, deadline, args.think_ms / 1000, args.max_plies, random.Random(rng.random()))))
+    for _ in range(spectators):
+        threads.append(threading.Thread(target=spectator_bot, args=(
+            stats, address, deadline, random.Random(rng.random()))))
+    for _ in range(replay_browsers):
+        threads.append(threading.Thread(target=replay_bot, args=(
+            stats, address, deadline, random.Random(rng.random()))))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    # players left without an opponent at the deadline are still waiting in the queue
+    for thread in threads:
+        thread.join(max(0.0, deadline + 5 - time.monotonic()))
+    stats.close_all()
+    for thread in threads:
+        thread.join(1)
+    return stats.samples, stats.counters
+
+
+def run(args):
+    stats = Stats()
+    process = None
+    directory = tempfile.TemporaryDirectory()
+    if args.connect:
+        host, port = args.connect.rsplit(':', 1)
+        address = (host, int(port))
+    else:
+        address = ('127.0.0.1', args.port)
+        process = start_server(args.port, args.use_async, directory.name)
+
+    try:
+        before = process_usage(process.pid) if process else None
+        start = time.monotonic()
+        deadline = start + args.duration
+        # the monotonic clock is shared by every process of the machine, so is the deadline
+        shares = [(args, address, deadline, args.seed * 1000 + index,
+                   split(args.players, args.processes, index), split(args.spectators, args.processes, index),
+                   split(args.replay_browsers, args.processes, index)) for index in range(args.processes)]
+        if args.processes == 1:
+            results = [run_bots(*shares[0])]
+        else:
+            with multiprocessing.Pool(args.processes) as pool:
+                results = pool.starmap(run_bots, shares)
+        for samples, counters in results:
+            stats.merge(samples, counters)
+        elapsed = time.monotonic() - start
+        after = process_usage(process.pid) if process else None
+    finally:
+        if process:
+            process.kill()
+            process.wait()
+        directory.cleanup()
+
+    report = {
+        'players': args.players,
+        'spectators': args.spectators,
+        'replay_browsers': args.replay_browsers,
+        'duration_s': elapsed,
+        'counters': dict(stats.counters),
+        'latency': {name: stats.summary(name) for name in
+                    ['matchmaking', 'move_round_trip', 'room_list', 'view_snapshot', 'replay_page', 'replay_stream']}
+    }
+    if before and after:
+        report['server'] = {
+            'cpu_s': after['cpu_s'] - before['cpu_s'],
+            'cpu_percent': (after['cpu_s'] - before['cpu_s']) / elapsed * 100,
+            'rss_kb': after['rss_kb'],
+            'peak_rss_kb': after['peak_rss_kb']
+        }
+    return report
+
+
+def print_report(report: dict, mode: str):
+    counters = report['counters']
+    print(f'[{mode}] {report["players"]} players, {report["spectators"]} spectators, '
+          f'{report["replay_browsers"]} replay browsers, {report["duration_s"]:.1f} s')
+    print(f'[{mode}] games {counters.get("games", 0) // 2}, moves {counters.get("moves", 0)}, '
+          f'view updates {counters.get("view_updates", 0)}, '
+          f'errors {counters.get("errors", 0) + counters.get("connect_errors", 0)}')
+    print(f'{"":<18}{"count":>8}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for name, summary in report['latency'].items():
+        if summary:
+            print(f'{name:<18}{summary["count"]:>8}{summary["p50_ms"]:>10.2f}{summary["p90_ms"]:>10.2f}'
+                  f'{summary["p99_ms"]:>10.2f}{summary["max_ms"]:>10.2f}')
+    server = report.get('server')
+    if server:
+        print(f'[{mode}] server cpu {server["cpu_s"]:.2f} s ({server["cpu_percent"]:.0f}% of one core), '
+              f'RSS {server["rss_kb"] / 1024:.1f} MB, peak {server["peak_rss_kb"] / 1024:.1f} MB')
+    # every frame goes between a bot and the server, so this is all the traffic of the server
+    print(f'[{mode}] on the wire: {counters.get("bytes_sent", 0) / 1e6:.2f} MB to the server, '
+          f'{counters.get("bytes_received", 0) / 1e6:.2f} MB from the server')
+
+
+# reasons to fail a CI run, empty if the run is fine
+def check(report: dict, max_p99_ms: float):
+    failures = []
+    counters = report['counters']
+    if counters.get('errors', 0) or counters.get('connect_errors', 0):
+        failures.append(f'{counters.get("errors", 0)} client errors, {counters.get("connect_errors", 0)} failed connects')
+    if report['players'] >= 2 and not counters.get('moves'):
+        failures.append('no move was played')
+    round_trip = report['latency']['move_round_trip']
+    if max_p99_ms and round_trip and round_trip['p99_ms'] > max_p99_ms:
+        failures.append(f'move round trip p99 {round_trip["p99_ms"]:.2f} ms is over {max_p99_ms} ms')
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless players, spectators and replay browsers against a server')
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--spectators', type=int, default=50)
+    parser.add_argument('--replay-browsers', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=10, help='seconds until the bots stop starting new work')
+    parser.add_argument('--think-ms', type=float, default=200, help='longest random pause before a move')
+    parser.add_argument('--max-plies', type=int, default=60, help='a player leaves the game after this many plies')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='spread the bots over this many processes, one process is limited by the GIL')
+    parser.add_argument('--port', type=int, default=5610)
+    parser.add_argument('--async', dest='use_async', action='store_true', help='start the asyncio server')
+    parser.add_argument('--connect', help='host:port of a running server instead of starting a local one')
+    parser.add_argument('--json', help='also write the report to this file')
+    parser.add_argument('--max-p99-ms', type=float, default=0,
+                        help='exit with an error when the move round trip p99 is higher, 0 disables the check')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    result = run(args)
+    print_report(result, 'async' if args.use_async else 'threaded')
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(result, output, indent=2)
+    problems = check(result, args.max_p99_ms)
+    for problem in problems:
+        print(f'FAILED: {problem}')
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,79 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+import chess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import movecache  # noqa: E402
+
+
+# (board, candidate move) pairs from random games, half of the candidates are illegal
+def sample_positions(count: int, seed: int):
+    rng = random.Random(seed)
+    samples = []
+    board = chess.Board()
+    while len(samples) < count:
+        if board.is_game_over():
+            board = chess.Board()
+        legal = list(board.legal_moves)
+        if rng.random() < 0.5:
+            candidate = rng.choice(legal)
+        else:
+            candidate = chess.Move(rng.randrange(64), rng.randrange(64))
+        samples.append((board.copy(stack=8), candidate))
+        board.push(rng.choice(legal))
+    return samples
+
+
+def rate(function, samples: list):
+    start = time.perf_counter()
+    for board, move in samples:
+        function(board, move)
+    return len(samples) / (time.perf_counter() - start)
+
+
+def main(count: int):
+    samples = sample_positions(count, 0)
+    # big enough for every sample, to time the lookup itself
+    cache = movecache.LegalMoveCache(max_size=count, max_plies=None)
+    infos = [cache.get(board) for board, _ in samples]
+
+    # the previous server trusted the client board and ran is_checkmate on it for every move
+    print(f'{"is_checkmate on client board":<38} {rate(lambda b, m: b.is_checkmate(), samples):12.0f} /s')
+    print(f'{"board.is_legal(move)":<38} {rate(lambda b, m: b.is_legal(m), samples):12.0f} /s')
+    print(f'{"move in set(board.legal_moves)":<38} {rate(lambda b, m: m in set(b.legal_moves), samples):12.0f} /s')
+
+    start = time.perf_counter()
+    for info, (_, move) in zip(infos, samples):
+        _ = move in info.legal_moves
+    lookup = len(samples) / (time.perf_counter() - start)
+    print(f'{"cached legal set lookup":<38} {lookup:12.0f} /s')
+
+    # client highlight of the selected piece, done on every redraw
+    def prefix_match(board, move):
+        selection = chess.square_name(move.from_square)
+        return [str(legal)[2:] for legal in list(board.legal_moves) if str(legal).startswith(selection)]
+
+    index = movecache.MoveIndex(max_size=count)
+    for board, _ in samples:
+        index.get(board)
+    print(f'{"legal move strings prefix match":<38} {rate(prefix_match, samples):12.0f} /s')
+    print(f'{"move index lookup (warm)":<38} '
+          f'{rate(lambda b, m: index.get(b).get(m.from_square, frozenset()), samples):12.0f} /s')
+
+    # cost paid once per new position when the move is pushed
+    cold = movecache.LegalMoveCache(max_size=count, max_plies=None)
+    print(f'{"cache fill + result after push (cold)":<38} '
+          f'{rate(lambda b, m: movecache.game_result(b, cold.get(b)), samples):12.0f} /s')
+    print(f'{"cache hit + result after push (warm)":<38} '
+          f'{rate(lambda b, m: movecache.game_result(b, cache.get(b)), samples):12.0f} /s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move validations per second on one core')
+    parser.add_argument('--positions', type=int, default=20000)
+    args = parser.parse_args()
+    main(args.positions)
@@ -0,0 +1,79 @@
+import argparse
+import os
+import pickle
+import random
+import sys
+import time
+
+import chess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol  # noqa: E402
+from utility import push_move  # noqa: E402
+
+
+# random legal game of at most max_plies plies, restarted from a new board if it ends early
+def random_moves(max_plies: int, seed: int):
+    rng = random.Random(seed)
+    board = chess.Board()
+    moves = []
+    while len(moves) < max_plies and not board.is_game_over():
+        move = rng.choice(list(board.legal_moves))
+        board.push(move)
+        moves.append(move)
+    return moves
+
+
+# per move payload of the previous protocol: the whole game dict with the pickled board
+def pickled_payloads(moves: list):
+    game = {'board': chess.Board(), 'moves_information': []}
+    payloads = []
+    for move in moves:
+        push_move(game['board'], game['moves_information'], move, 1000)
+        payloads.append(pickle.dumps(game))
+    return payloads
+
+
+def binary_payloads(moves: list):
+    return [protocol.encode_move(ply, move, 1000) for ply, move in enumerate(moves)]
+
+
+def throughput(function, items: list, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            function(item)
+    elapsed = time.perf_counter() - start
+    return len(items) * repeat / elapsed
+
+
+def main(plies: int, games: int):
+    moves = []
+    while len(moves) < plies * games:
+        moves.extend(random_moves(plies, len(moves)))
+    game_moves = moves[:plies]
+
+    old = pickled_payloads(game_moves)
+    new = binary_payloads(game_moves)
+    print(f'payload per move over a {len(game_moves)}-ply game')
+    print(f'  pickled game dict: first {len(old[0])} B, last {len(old[-1])} B, '
+          f'total {sum(map(len, old)) / 1024:.1f} KB')
+    print(f'  binary move:       {len(new[0])} B each, total {sum(map(len, new)) / 1024:.1f} KB')
+
+    game = {'board': chess.Board(), 'moves_information': []}
+    for move in game_moves:
+        push_move(game['board'], game['moves_information'], move, 1000)
+    repeat = max(1, 20000 // len(game_moves))
+    print(f'encode/decode throughput ({len(game_moves)}-ply position)')
+    print(f'  pickle.dumps game dict: {throughput(lambda _: pickle.dumps(game), game_moves, 1):12.0f} /s')
+    print(f'  pickle.loads game dict: {throughput(pickle.loads, old[-1:] * 200, 1):12.0f} /s')
+    print(f'  encode_move:            {throughput(lambda m: protocol.encode_move(0, m, 1000), moves, repeat):12.0f} /s')
+    print(f'  decode move:            {throughput(protocol.loads, binary_payloads(moves), repeat):12.0f} /s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Payload size and encode/decode speed of the move protocol')
+    parser.add_argument('--plies', type=int, default=400)
+    parser.add_argument('--games', type=int, default=5)
+    args = parser.parse_args()
+    main(args.plies, args.games)
@@ -0,0 +1,235 @@
+import argparse
+import collections
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import chess  # noqa: E402
+import protocol  # noqa: E402
+import scheduler  # noqa: E402
+from server import Server  # noqa: E402
+from utility import Message  # noqa: E402
+
+
+# stands in for a client socket, remembers the game it was put in
+class FakeConnection:
+    def __init__(self):
+        self.game_id = None
+        self.matched = threading.Event()
+        self.frames = 0
+
+    def send_frame(self, payload: bytes):
+        self.frames += 1
+        if self.game_id is None and payload[:1] == b'\x80':
+            data = protocol.loads(payload)
+            if isinstance(data, dict):
+                self.game_id = data['game_id']
+                self.matched.set()
+
+    def close(self):
+        pass
+
+
+# counts every error the server logs, the server catches most exceptions itself
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = collections.Counter()
+
+    def emit(self, record: logging.LogRecord):
+        self.messages[record.getMessage()] += 1
+
+
+class Stress:
+    def __init__(self, server: Server, args):
+        self.server = server
+        self.args = args
+        self.lock = threading.Lock()
+        self.failures = collections.Counter()
+        self.counters = collections.Counter()
+        self.stop = threading.Event()
+
+    def fail(self, where: str, er: Exception):
+        with self.lock:
+            self.failures[f'{where}: {type(er).__name__}: {er}'] += 1
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    # plays random moves on its turn, sometimes stalls long enough to lose on time, then leaves
+    def player(self, player_id: int, con: FakeConnection, rng: random.Random):
+        try:
+            if rng.random() < self.args.leave_queue or not con.matched.wait(self.args.match_timeout):
+                self.count('left_queue')
+                self.server.disconnect_player(player_id)
+                return
+
+            game_id = con.game_id
+            for _ in range(self.args.max_plies):
+                time.sleep(rng.random() * self.args.think_ms / 1000)
+                if rng.random() < self.args.stall:
+                    time.sleep(self.args.player_seconds + 0.5)
+                game = self.server.games.get(game_id)
+                if game is None or game['winner'] != '' or game['state'] != Message.READY:
+                    break
+                board = game['board'].copy()
+                if (game['white'] == player_id) != board.turn:
+                    continue
+                legal_moves = list(board.legal_moves)
+                if not legal_moves:
+                    break
+                move = protocol.MoveMessage(len(board.move_stack), rng.choice(legal_moves), rng.randrange(1000))
+                try:
+                    self.server.handle_player_data(player_id, move)
+                    self.count('moves')
+                except Exception as er:
+                    self.fail('move', er)
+                    break
+            self.server.disconnect_player(player_id)
+        except Exception as er:
+            self.fail('player', er)
+
+    # watches random running games until the players are done
+    def viewer(self, rng: random.Random):
+        while not self.stop.is_set():
+            try:
+                active_games = self.server.get_active_games()
+                if not active_games:
+                    time.sleep(0.01)
+                    continue
+                game_id = rng.choice(active_games)[0]
+                con = FakeConnection()
+                self.server.add_subscriber(game_id, con)
+                time.sleep(rng.random() * self.args.think_ms * 4 / 1000)
+                self.server.remove_subscriber(game_id, con)
+                self.count('views')
+            except Exception as er:
+                self.fail('viewer', er)
+
+    # what every room list request of a spectator does
+    def lister(self):
+        while not self.stop.is_set():
+            try:
+                self.server.get_active_games()
+                self.count('listings')
+            except Exception as er:
+                self.fail('listing', er)
+
+    def run(self):
+        rng = random.Random(self.args.seed)
+        matcher = threading.Thread(target=self.server.player_queue_handle, daemon=True)
+        matcher.start()
+        self.server.clock_scheduler.start()
+        background = [threading.Thread(target=self.viewer, args=(random.Random(rng.random()),), daemon=True)
+                      for _ in range(self.args.viewers)]
+        background += [threading.Thread(target=self.lister, daemon=True) for _ in range(self.args.listers)]
+        for thread in background:
+            thread.start()
+
+        # players arrive one at a time like on the accept thread, and all play at once
+        players = []
+        for _ in range(self.args.games * 2):
+            con = FakeConnection()
+            player_id = self.server.add_player(con)
+            thread = threading.Thread(target=self.player, args=(player_id, con, random.Random(rng.random())),
+                                      daemon=True)
+            thread.start()
+            players.append(thread)
+        for thread in players:
+            thread.join()
+        self.stop.set()
+        for thread in background:
+            thread.join()
+        # the last flag falls and replay writes are done by other threads
+        time.sleep(0.5)
+        if not matcher.is_alive():
+            self.failures['matchmaking thread died'] += 1
+
+    # every game must have ended and left the server: exactly one replay each with a legal move history
+    # and a winner, and nothing kept in memory for it but the recent games
+    def check(self):
+        server = self.server
+        problems = collections.Counter()
+        played = server.num_games
+        replays = 0
+        for _, game in server.replay_store.scan():
+            replays += 1
+            board = chess.Board()
+            for move in game['board'].move_stack:
+                if not board.is_legal(move):
+                    problems['illegal move in a replay'] += 1
+                    break
+                board.push(move)
+            if game['white'] is None or game['black'] is None:
+                problems['replay saved after a player was removed'] += 1
+            if game['winner'] not in ('WHITE', 'BLACK', 'DRAW'):
+                problems['finished game without a winner'] += 1
+        if replays != played or len(server.replay_catalogue) != played:
+            problems[f'{replays} replays ({len(server.replay_catalogue)} listed) saved for {played} games'] += 1
+        if len(server.games) or server.num_retired != played:
+            problems[f'{len(server.games)} games still running, {server.num_retired} of {played} retired'] += 1
+        if server.positions or any(server.subscribers.values()) or server.snapshots.entries:
+            problems['positions, subscribers or snapshots left behind by retired games'] += 1
+        if len(server.finished_games) > server.finished_games.capacity:
+            problems['more recent games kept than allowed'] += 1
+        if server.connecting_players:
+            problems[f'{len(server.connecting_players)} players left in the player table'] += 1
+        if len(server.player_queue):
+            problems[f'{len(server.player_queue)} players left in the queue'] += 1
+        return played, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hundreds of concurrent games, viewers and disconnects against '
+                                                 'one in-process server, then a consistency check of every game')
+    parser.add_argument('--games', type=int, default=300)
+    parser.add_argument('--viewers', type=int, default=200)
+    parser.add_argument('--listers', type=int, default=4)
+    parser.add_argument('--max-plies', type=int, default=40)
+    parser.add_argument('--think-ms', type=float, default=20)
+    parser.add_argument('--player-seconds', type=float, default=1.5, help='clock of each player')
+    parser.add_argument('--stall', type=float, default=0.01, help='chance that a player lets its clock run out')
+    parser.add_argument('--leave-queue', type=float, default=0.05, help='chance that a player leaves the queue')
+    parser.add_argument('--match-timeout', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.TemporaryDirectory()
+    # the server keeps its replays in its working directory
+    os.chdir(directory.name)
+    control = scheduler.TimeControl(args.player_seconds * 4, args.player_seconds, 0, 0)
+    server = Server('127.0.0.1', 0, control)
+    errors = ErrorCounter()
+    server.logger.handlers = [errors]
+    server.logger.propagate = False
+
+    stress = Stress(server, args)
+    start = time.monotonic()
+    stress.run()
+    elapsed = time.monotonic() - start
+    played, problems = stress.check()
+    server.replay_store.close()
+
+    counters = stress.counters
+    print(f'{played} games, {counters["moves"]} moves, {counters["views"]} views, '
+          f'{counters["listings"]} listings, {counters["left_queue"]} players left the queue, {elapsed:.1f} s')
+    for name, failures in (('exceptions', stress.failures), ('logged errors', errors.messages),
+                           ('inconsistent state', problems)):
+        if failures:
+            print(f'{name}:')
+            for message, count in failures.most_common(10):
+                print(f'  {count:>6} x {message}')
+    if stress.failures or errors.messages or problems:
+        sys.exit(1)
+    print('no errors, every game consistent')
+
+
+if __name__ == '__main__':
+    main()
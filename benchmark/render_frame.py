@@ -0,0 +1,96 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import chess  # noqa: E402
+import pygame  # noqa: E402
+from assets import RenderAssets  # noqa: E402
+from game import Game  # noqa: E402
+from utility import Message  # noqa: E402
+
+OPENING = ['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1b5', 'a7a6', 'b5c6', 'd7c6', 'e1g1', 'f7f6']
+
+
+# what the game drew before the cache: a new font and text surface per call, images read from disk
+class UncachedAssets(RenderAssets):
+    def font(self, size: int):
+        return pygame.font.Font('freesansbold.ttf', size)
+
+    def text(self, text: str, size: int, color):
+        return self.font(size).render(text, True, color)
+
+    def image(self, path: str):
+        return pygame.image.load(path)
+
+
+# squares drawn from primitives instead of copied from the pre-drawn board
+class UncachedGame(Game):
+    def draw_empty_squares(self, rects: list):
+        for rect in rects:
+            col, row = rect.x // self.title_size, rect.y // self.title_size
+            pygame.draw.rect(self.screen, '#ffcf9f' if (col + row) % 2 == 0 else '#d28c45', rect)
+            pygame.draw.line(self.screen, 'black', rect.topleft, (rect.right - 1, rect.top), 1)
+            pygame.draw.line(self.screen, 'black', rect.topleft, (rect.left, rect.bottom - 1), 1)
+
+
+class FakeClient:
+    client_id = 1
+
+
+def make_game(assets: RenderAssets):
+    game = (UncachedGame if isinstance(assets, UncachedAssets) else Game)(FakeClient())
+    game.assets = assets
+    for uci in OPENING:
+        game.connection.push_local(chess.Move.from_uci(uci), 1000)
+    game.connection.state = game.connection.state._replace(state=Message.READY)
+    game.update_game_state()
+    game.selection = 'f3'
+    return game
+
+
+# full redraw of the board, both side boards and the valid move dots
+def full_frame(game: Game):
+    game.dirty.invalidate()
+    game.render()
+
+
+# one clock tick, only the info board changes
+def clock_frame(game: Game):
+    game.game_state = game.game_state._replace(time_reference=game.game_state.time_reference - 1)
+    game.render()
+
+
+def waiting_frame(game: Game):
+    game.screen.fill('#ffcf9f')
+    game.draw_waiting()
+
+
+def measure(frame, game: Game, frames: int):
+    timings = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        frame(game)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per frame render time with and without the asset cache')
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    print(f'{"frame":<10}{"uncached p50 ms":>18}{"cached p50 ms":>16}{"uncached max":>15}{"cached max":>13}')
+    for name, frame in [('full', full_frame), ('clock', clock_frame), ('waiting', waiting_frame)]:
+        uncached = measure(frame, make_game(UncachedAssets()), args.frames)
+        cached_game = make_game(RenderAssets())
+        frame(cached_game)
+        cached = measure(frame, cached_game, args.frames)
+        print(f'{name:<10}{uncached[0]:>18.3f}{cached[0]:>16.3f}{uncached[1]:>15.3f}{cached[1]:>13.3f}')
+    pygame.quit()
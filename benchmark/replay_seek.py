@@ -0,0 +1,89 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import chess  # noqa: E402
+import pygame  # noqa: E402
+from game import GameReplay  # noqa: E402
+from utility import push_move  # noqa: E402
+
+
+class FakeClient:
+    client_id = 1
+
+
+# random game of exactly plies plies, new seeds are tried until one lasts that long
+def long_game(plies: int, seed: int):
+    while True:
+        rng = random.Random(seed)
+        board = chess.Board()
+        moves_information = []
+        while len(board.move_stack) < plies:
+            legal_moves = list(board.legal_moves)
+            if not legal_moves:
+                break
+            push_move(board, moves_information, rng.choice(legal_moves), rng.randrange(5000))
+        if len(board.move_stack) == plies:
+            return board, moves_information
+        seed += 1000
+
+
+# what the replay could do before: step one ply at a time with next/previous
+def step_to(replay: GameReplay, move: int):
+    while replay.current_move < move:
+        replay.next()
+    while replay.current_move > move:
+        replay.previous()
+
+
+def measure(replay: GameReplay, seek, targets: list):
+    timings = []
+    for target in targets:
+        start = time.perf_counter()
+        seek(replay, target)
+        timings.append((time.perf_counter() - start) * 1e6)
+        assert replay.current_move == target
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1], timings[-1]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay seek latency on long games')
+    parser.add_argument('--plies', type=int, default=500)
+    parser.add_argument('--seeks', type=int, default=500)
+    args = parser.parse_args()
+
+    board, moves_information = long_game(args.plies, 0)
+    rng = random.Random(1)
+    targets = [rng.randrange(args.plies + 2) for _ in range(args.seeks)]
+
+    results = {
+        'step with next/previous': measure(GameReplay(FakeClient(), board, moves_information, 'DRAW'),
+                                           step_to, targets),
+        'seek from snapshots': measure(GameReplay(FakeClient(), board, moves_information, 'DRAW'),
+                                       GameReplay.seek, targets)
+    }
+
+    # every seek has to end on the same position as replaying the game from the start
+    replay = GameReplay(FakeClient(), board, moves_information, 'DRAW')
+    for target in targets:
+        replay.seek(target)
+        expected = chess.Board()
+        for move in board.move_stack[:min(target, args.plies)]:
+            expected.push(move)
+        assert replay.board.fen() == expected.fen()
+        assert replay.board.move_stack[-1:] == expected.move_stack[-1:]
+
+    print(f'{args.plies} ply game, {args.seeks} random seeks')
+    print(f'{"":<26}{"p50 us":>10}{"p99 us":>10}{"max us":>10}')
+    for name, (p50, p99, worst) in results.items():
+        print(f'{name:<26}{p50:>10.0f}{p99:>10.0f}{worst:>10.0f}')
+    pygame.quit()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import pickle
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from registry import RoomList  # noqa: E402
+
+
+# changes rooms like a busy server between two refreshes: new games, viewers coming and going, games ending
+def churn(rooms: RoomList, rng: random.Random, changes: int, next_id: int):
+    for _ in range(changes):
+        kind = rng.random()
+        if kind < 0.2:
+            rooms.update(next_id, 0)
+            next_id += 1
+        elif kind < 0.8:
+            game_id = rng.randrange(next_id)
+            if game_id in rooms.rooms:
+                rooms.update(game_id, rng.randrange(20))
+        else:
+            rooms.remove(rng.randrange(next_id))
+    return next_id
+
+
+def measure(request, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = pickle.dumps(request())
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings), len(payload)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Room list refresh: the whole list against the changes since the '
+                                                 'last refresh')
+    parser.add_argument('--rooms', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rooms = RoomList()
+    for game_id in range(args.rooms):
+        rooms.update(game_id, rng.randrange(20))
+    next_id = args.rooms
+
+    print(f'{args.rooms} rooms, one refresh after each number of changes')
+    print(f'{"changes":>8}{"full us":>10}{"full bytes":>12}{"delta us":>10}{"delta bytes":>13}')
+    for changes in (0, 1, 10, 100, 1000):
+        version = rooms.version
+        next_id = churn(rooms, rng, changes, next_id)
+        full_us, full_bytes = measure(rooms.listing, args.repeat)
+        delta_us, delta_bytes = measure(lambda: rooms.changes_since(version), args.repeat)
+        print(f'{changes:>8}{full_us:>10.0f}{full_bytes:>12}{delta_us:>10.0f}{delta_bytes:>13}')
@@ -0,0 +1,116 @@
+import argparse
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+import chess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol  # noqa: E402
+from client import Client  # noqa: E402
+from utility import Message  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def process_status(pid: int):
+    status = {}
+    with open(f'/proc/{pid}/status') as file:
+        for line in file:
+            key, value = line.split(':', 1)
+            status[key] = value.strip()
+    return int(status['VmRSS'].split()[0]), int(status['Threads'])
+
+
+def start_server(port: int, use_async: bool):
+    command = [sys.executable, 'server.py', '--port', str(port)]
+    if use_async:
+        command.append('--async')
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1)
+    return process
+
+
+def connect_viewers(port: int, count: int):
+    viewers = []
+    for _ in range(count):
+        viewer = Client(Message.VIEW, server_port=port)
+        if viewer.client_id is None:
+            break
+        viewers.append(viewer)
+    return viewers
+
+
+# two players bounce random legal moves, every relay is timed from send to receive
+# a fresh pair is matched whenever a game is over
+def measure_relay(port: int, moves: int):
+    latencies = []
+    while len(latencies) < moves:
+        white = Client(Message.PLAY, server_port=port)
+        black = Client(Message.PLAY, server_port=port)
+        white.receive()
+        black.receive()
+
+        board = chess.Board()
+        sender, receiver = white, black
+        while not board.is_game_over() and len(latencies) < moves:
+            move = random.choice(list(board.legal_moves))
+            start = time.perf_counter()
+            sender.send_payload(protocol.encode_move(len(board.move_stack), move, 0))
+            board.push(move)
+            receiver.receive()
+            latencies.append(time.perf_counter() - start)
+            sender, receiver = receiver, sender
+
+        white.client_socket.close()
+        black.client_socket.close()
+    return latencies
+
+
+def run(use_async: bool, port: int, viewers: int, moves: int):
+    process = start_server(port, use_async)
+    try:
+        base_rss, base_threads = process_status(process.pid)
+        clients = connect_viewers(port, viewers)
+        time.sleep(0.5)
+        rss, threads = process_status(process.pid)
+        latencies = measure_relay(port, moves)
+        latencies.sort()
+
+        mode = 'async' if use_async else 'threaded'
+        print(f'[{mode}] idle viewers connected: {len(clients)}/{viewers}')
+        print(f'[{mode}] server threads: {base_threads} -> {threads}, '
+              f'RSS: {base_rss / 1024:.1f} MB -> {rss / 1024:.1f} MB '
+              f'({(rss - base_rss) / max(len(clients), 1):.1f} KB per connection)')
+        print(f'[{mode}] move relay over {len(latencies)} moves: '
+              f'p50 {statistics.median(latencies) * 1000:.3f} ms, '
+              f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.3f} ms')
+        for client in clients:
+            client.client_socket.close()
+    finally:
+        process.kill()
+        process.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Connections per process and move relay latency of the server')
+    parser.add_argument('--viewers', type=int, default=2000)
+    parser.add_argument('--moves', type=int, default=400)
+    parser.add_argument('--port', type=int, default=5600)
+    parser.add_argument('--mode', choices=['threaded', 'async', 'both'], default='both')
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    if args.mode in ('threaded', 'both'):
+        run(False, args.port, args.viewers, args.moves)
+    if args.mode in ('async', 'both'):
+        run(True, args.port + 1, args.viewers, args.moves)
@@ -1,6 +1,9 @@
 import pickle
 import socket
 
+import protocol
+from framing import Connection
+
 
 class Client:
     def __init__(self, action: str, server_ip='127.0.0.1', server_port=5555):
@@ -9,6 +12,7 @@ class Client:
         self.server_port = server_port
         self.header_length = 4
         self.action = action
+        self.connection = Connection(self.client_socket, self.header_length)
         self.client_id = self.connect()
 
     def connect(self):
@@ -22,10 +26,16 @@ class Client:
     # send data length first, data second
     def send(self, data):
         try:
-            send_data = pickle.dumps(data)
-            send_length = len(send_data)
-            self.client_socket.sendall(send_length.to_bytes(self.header_length, byteorder='big'))
-            self.client_socket.sendall(send_data)
+            self.connection.send_frame(pickle.dumps(data))
+            return True
+        except Exception as er:
+            print(er)
+            return False
+
+    # send an already encoded payload
+    def send_payload(self, payload: bytes):
+        try:
+            self.connection.send_frame(payload)
             return True
         except Exception as er:
             print(er)
@@ -34,9 +44,10 @@ class Client:
     # receive data length first, data second
     def receive(self):
         try:
-            receive_length = int.from_bytes(self.client_socket.recv(self.header_length), byteorder='big')
-            receive_data = pickle.loads(self.client_socket.recv(receive_length))
-            return receive_data
+            receive_data = self.connection.receive_frame()
+            if receive_data is None:
+                return None
+            return protocol.loads(receive_data)
         except Exception as er:
             print(er)
 
@@ -0,0 +1,314 @@
+import multiprocessing
+import os
+import pickle
+import select
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+import scheduler
+import utility
+from framing import Connection, QueuedConnection
+from registry import RECENT_GAMES
+from replay_store import encode_record
+from server import Server, parse_args, time_control
+from utility import Message
+
+# largest control message, a finished game carries its encoded replay record
+CHANNEL_BUFFER = 1 << 20
+
+
+# one end of the control channel between the supervisor and a worker
+# a SEQPACKET socket keeps message boundaries, client sockets travel along as SCM_RIGHTS file descriptors
+class Channel:
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self.send_lock = threading.Lock()
+
+    def send(self, message: tuple, fds=()):
+        with self.send_lock:
+            socket.send_fds(self.socket, [pickle.dumps(message)], list(fds))
+
+    # (message, fds), None when the other process is gone
+    def receive(self):
+        data, fds, _, _ = socket.recv_fds(self.socket, CHANNEL_BUFFER, 2)
+        if not data:
+            return None
+        return pickle.loads(data), fds
+
+    def close(self):
+        self.socket.close()
+
+
+# a worker as seen by the supervisor
+class WorkerHandle:
+    def __init__(self, index: int, process: multiprocessing.Process, channel: Channel):
+        self.index = index
+        self.process = process
+        self.channel = channel
+        self.games = 0
+        # cleared when the channel closes, no game is handed to it after that
+        self.alive = True
+
+
+# accepts every connection and owns everything shared by the workers: player and game ids, matchmaking,
+# the list of running games and the replays
+# a matched pair is handed to the worker with the fewest games, viewers of a game follow it to the same worker,
+# so a game and all of its connections always live in one process
+class Supervisor(Server):
+    def __init__(self, ip='127.0.0.1', port=5555, time_control=scheduler.DEFAULT_TIME_CONTROL, num_workers=2):
+        super().__init__(ip, port, time_control)
+        self.num_workers = num_workers
+        self.workers = []
+        # game id -> worker index of every running game, the rooms are listed in self.rooms
+        self.directory = {}
+        # game id -> worker index of the recently finished games, their workers still show them to late spectators
+        self.finished_directory = OrderedDict()
+        self.directory_lock = threading.Lock()
+
+    def start_workers(self):
+        for index in range(self.num_workers):
+            self.workers.append(self.start_worker(index))
+
+    # spawned, not forked, a worker must not inherit the listening socket or the replay database
+    def start_worker(self, index: int):
+        context = multiprocessing.get_context('spawn')
+        supervisor_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        process = context.Process(target=run_worker, args=(index, worker_end, self.time_control), daemon=True)
+        process.start()
+        worker_end.close()
+        worker = WorkerHandle(index, process, Channel(supervisor_end))
+        threading.Thread(target=self.worker_handle, args=(worker,), daemon=True).start()
+        return worker
+
+    # reports of one worker: room changes and finished games
+    def worker_handle(self, worker: WorkerHandle):
+        while True:
+            try:
+                received = worker.channel.receive()
+                if received is None:
+                    break
+                message, _ = received
+                if message[0] == 'room':
+                    _, game_id, viewers = message
+                    with self.directory_lock:
+                        if game_id in self.directory and viewers is None:
+                            self.rooms.remove(game_id)
+                        elif game_id in self.directory:
+                            self.rooms.update(game_id, viewers)
+                elif message[0] == 'finished':
+                    _, game_id, record = message
+                    with self.directory_lock:
+                        self.directory.pop(game_id, None)
+                        self.rooms.remove(game_id)
+                        worker.games -= 1
+                        self.finished_directory[game_id] = worker.index
+                        while len(self.finished_directory) > RECENT_GAMES:
+                            self.finished_directory.popitem(last=False)
+                    if record is not None:
+                        self.save_record(record)
+            except Exception as er:
+                self.logger.error(str(er))
+                break
+        self.replace_worker(worker)
+
+    # the games of a worker end with its process, their players and viewers see the connection close
+    # its rooms are unlisted and a new worker takes its place
+    def replace_worker(self, worker: WorkerHandle):
+        with self.directory_lock:
+            worker.alive = False
+            lost = [game_id for game_id, index in self.directory.items() if index == worker.index]
+            for game_id in lost:
+                del self.directory[game_id]
+                self.rooms.remove(game_id)
+            for game_id in [game_id for game_id, index in self.finished_directory.items() if index == worker.index]:
+                del self.finished_directory[game_id]
+        worker.channel.close()
+        worker.process.join(1)
+        self.logger.error(f'Worker {worker.index} stopped, {len(lost)} games lost')
+
+        replacement = self.start_worker(worker.index)
+        with self.directory_lock:
+            self.workers[worker.index] = replacement
+        self.logger.info(f'Worker {worker.index} restarted, pid {replacement.process.pid}')
+
+    # queued players only send something once they are in a game, a readable socket is a closed one
+    def queue_watch(self):
+        while True:
+            waiting = [(player_id, player['connection']) for player_id, player in list(self.connecting_players.items())]
+            poller = select.poll()
+            sockets = {}
+            for player_id, con in waiting:
+                try:
+                    poller.register(con.socket, select.POLLIN)
+                    sockets[con.socket.fileno()] = (player_id, con)
+                except (OSError, ValueError):
+                    # handed over to a worker in the meantime
+                    pass
+            for fd, _ in poller.poll(200):
+                player_id, con = sockets[fd]
+                try:
+                    closed = con.socket.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+                except BlockingIOError:
+                    closed = False
+                except OSError:
+                    closed = True
+                # False if the player was matched meanwhile, the worker then sees the closed socket
+                if closed and self.player_queue.remove(player_id):
+                    self.connecting_players.pop(player_id, None)
+                    con.close()
+                    self.logger.info(f'Player {player_id} disconnected')
+
+    # called by the matchmaking thread, the game itself is created by a worker
+    def create_game(self, white: int, black: int, game_id=None):
+        game_id = self.num_games
+        self.num_games += 1
+        white_con = self.connecting_players.pop(white)['connection']
+        black_con = self.connecting_players.pop(black)['connection']
+        with self.directory_lock:
+            workers = [handle for handle in self.workers if handle.alive]
+            worker = min(workers, key=lambda handle: handle.games) if workers else None
+            if worker is not None:
+                worker.games += 1
+                self.directory[game_id] = worker.index
+                self.rooms.update(game_id, 0)
+        try:
+            if worker is None:
+                raise ConnectionError('no worker is running')
+            worker.channel.send(('game', game_id, white, black), [white_con.socket.fileno(), black_con.socket.fileno()])
+        except Exception as er:
+            self.logger.error(f'Game {game_id} could not be started: {er}')
+            self.requeue_players(game_id, worker, (white, white_con), (black, black_con))
+            return
+        # the worker has its own copies of the sockets now
+        white_con.close()
+        black_con.close()
+        self.logger.info(f'Game {game_id} started on worker {worker.index}')
+
+    # the game never reached a worker, its players are still connected here and wait for the next one
+    def requeue_players(self, game_id: int, worker, *players):
+        if worker is None:
+            # a worker that stopped is being replaced
+            time.sleep(0.1)
+        else:
+            with self.directory_lock:
+                worker.games -= 1
+                self.directory.pop(game_id, None)
+                self.rooms.remove(game_id)
+        for player_id, con in players:
+            self.connecting_players[player_id] = {'connection': con, 'game_id': None}
+            self.player_queue.append(player_id)
+
+    def view_game(self, con: Connection, game_id: int):
+        with self.directory_lock:
+            index = self.directory.get(game_id, self.finished_directory.get(game_id))
+        if index is None:
+            raise KeyError(f'Game {game_id} does not exist')
+        self.workers[index].channel.send(('view', game_id), [con.socket.fileno()])
+        self.logger.debug(f'Viewer of game {game_id} handed to worker {index}')
+
+    def get_metrics(self):
+        metrics = super().get_metrics()
+        with self.directory_lock:
+            metrics['workers'] = [{'pid': worker.process.pid, 'games': worker.games,
+                                   'rss_kb': utility.memory_usage(worker.process.pid)[0]} for worker in self.workers]
+        return metrics
+
+    def start(self):
+        self.start_workers()
+        self.server_socket.listen()
+        self.logger.info(f"Waiting for connection, supervisor started with {self.num_workers} workers")
+        threading.Thread(target=self.player_queue_handle, daemon=True).start()
+        threading.Thread(target=self.queue_watch, daemon=True).start()
+
+        while True:
+            con, addr = self.server_socket.accept()
+            con = Connection(con, self.header_length)
+            action = self.receive(con)
+
+            # players wait in the queue without a thread until they are matched
+            if action == Message.PLAY:
+                self.add_player(con)
+
+            # viewers list the games here and are handed to the worker of the game they pick
+            elif action == Message.VIEW:
+                client_id = self.add_viewer(con)
+                thread = threading.Thread(target=self.client_view, args=(con, client_id))
+                thread.start()
+
+            # replays are stored and served by the supervisor
+            else:
+                client_id = self.add_replay(con)
+                thread = threading.Thread(target=self.client_replay, args=(con, client_id))
+                thread.start()
+
+
+# plays the games the supervisor hands over, with the same game logic as a single Server
+class Worker(Server):
+    def __init__(self, index: int, channel: Channel, time_control=scheduler.DEFAULT_TIME_CONTROL):
+        self.index = index
+        self.channel = channel
+        super().__init__(time_control=time_control)
+
+    # the supervisor listens and stores the replays
+    def bind_socket(self):
+        self.server_socket.close()
+        return True
+
+    def open_replays(self):
+        return None, None
+
+    def save_game_replay(self, game_id: int):
+        record = encode_record(int(time.time()), self.games[game_id])
+        self.channel.send(('finished', game_id, record))
+
+    # the supervisor lists the rooms, viewers is None once the game is no longer listed
+    def update_room(self, game_id: int, game: dict):
+        self.channel.send(('room', game_id, game['viewers'] if self.is_listed(game) else None))
+
+    def start_game(self, game_id: int, white: int, black: int, fds: list):
+        for player_id, fd in zip((white, black), fds):
+            con = QueuedConnection(socket.socket(fileno=fd), self.header_length)
+            self.connecting_players[player_id] = {'connection': con, 'game_id': None}
+        self.create_game(white, black, game_id)
+        for player_id in (white, black):
+            thread = threading.Thread(target=self.client_play,
+                                      args=(self.connecting_players[player_id]['connection'], player_id))
+            thread.start()
+
+    # a viewer handed over by the supervisor, it already picked the game
+    def client_watch(self, con: Connection, game_id: int):
+        try:
+            self.view_game(con, game_id)
+        except Exception as er:
+            self.logger.error(str(er))
+        con.close()
+
+    def start(self):
+        self.clock_scheduler.start()
+        self.logger.info(f'Worker {self.index} started, pid {os.getpid()}')
+        while True:
+            received = self.channel.receive()
+            if received is None:
+                break
+            message, fds = received
+            if message[0] == 'game':
+                _, game_id, white, black = message
+                self.start_game(game_id, white, black, fds)
+            elif message[0] == 'view':
+                con = QueuedConnection(socket.socket(fileno=fds[0]), self.header_length)
+                thread = threading.Thread(target=self.client_watch, args=(con, message[1]))
+                thread.start()
+        self.logger.info(f'Worker {self.index} stopped, the supervisor is gone')
+        os._exit(0)
+
+
+def run_worker(index: int, sock: socket.socket, control: scheduler.TimeControl):
+    Worker(index, Channel(sock), control).start()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    server = Supervisor(args.ip, args.port, time_control(args), max(1, args.workers))
+    server.start()
@@ -0,0 +1,152 @@
+import socket
+import struct
+import threading
+from collections import deque
+
+HEADER_LENGTH = 4
+# bytes a peer may fall behind before it is disconnected
+MAX_PENDING_BYTES = 4 * 1024 * 1024
+# seconds one write may wait for a peer that stopped reading
+WRITE_TIMEOUT = 10
+
+
+# socket wrapper for length-prefixed frames
+# receive reads exact lengths into one reusable buffer, send writes header and payload as one frame
+class Connection:
+    def __init__(self, sock: socket.socket, header_length=HEADER_LENGTH, buffer_size=4096):
+        self.socket = sock
+        self.header_length = header_length
+        self.header = bytearray(header_length)
+        self.header_view = memoryview(self.header)
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.send_lock = threading.Lock()
+        # a frame is written in one call, do not let Nagle hold back its tail
+        try:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+
+    # keep calling recv_into until the view is full, False if the peer closed the connection
+    def receive_exact(self, view: memoryview):
+        size = len(view)
+        # a whole frame usually arrives in one call, only slice the view for the remainder
+        received = self.socket.recv_into(view, size)
+        while received < size:
+            if received == 0:
+                return False
+            length = self.socket.recv_into(view[received:], size - received)
+            if length == 0:
+                return False
+            received += length
+        return True
+
+    # return a memoryview of the next payload, it is only valid until the next call
+    # None if the connection was closed
+    def receive_frame(self):
+        if not self.receive_exact(self.header_view):
+            return None
+        length = int.from_bytes(self.header, byteorder='big')
+        if length > len(self.buffer):
+            self.buffer = bytearray(max(length, len(self.buffer) * 2))
+            self.view = memoryview(self.buffer)
+        payload = self.view[:length]
+        if not self.receive_exact(payload):
+            return None
+        return payload
+
+    # frames from different threads (relay, clock events) must not interleave
+    def send_frame(self, payload):
+        frame = len(payload).to_bytes(self.header_length, byteorder='big') + payload
+        with self.send_lock:
+            self.socket.sendall(frame)
+
+    def close(self):
+        self.socket.close()
+
+
+# a sender never waits for the peer: a frame is written right away as far as the socket takes it without
+# blocking, the rest is queued for a writer thread that is only started once a peer falls behind
+# a peer that falls more than max_pending bytes behind or stops reading is disconnected,
+# so one slow client cannot hold up the threads that send to everyone else
+class QueuedConnection(Connection):
+    def __init__(self, sock: socket.socket, header_length=HEADER_LENGTH, buffer_size=4096,
+                 max_pending=MAX_PENDING_BYTES):
+        super().__init__(sock, header_length, buffer_size)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.frames = deque()
+        # set while the writer sends a frame it took from the queue
+        self.writing = False
+        self.condition = threading.Condition()
+        self.closed = False
+        self.writer = None
+        # a timeout for sends only, receiving keeps blocking
+        try:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, struct.pack('ll', WRITE_TIMEOUT, 0))
+        except OSError:
+            pass
+
+    def send_frame(self, payload):
+        frame = len(payload).to_bytes(self.header_length, byteorder='big') + payload
+        with self.condition:
+            if self.closed:
+                raise ConnectionError('Connection is closed')
+            if not self.frames and not self.writing:
+                try:
+                    sent = self.socket.send(frame, socket.MSG_DONTWAIT)
+                except BlockingIOError:
+                    sent = 0
+                except OSError:
+                    self.abort()
+                    raise
+                if sent == len(frame):
+                    return
+                frame = frame[sent:]
+            if self.pending + len(frame) > self.max_pending:
+                self.abort()
+                raise ConnectionError(f'Peer fell {self.pending} bytes behind, connection dropped')
+            self.frames.append(frame)
+            self.pending += len(frame)
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.write_loop, daemon=True)
+                self.writer.start()
+            self.condition.notify()
+
+    def write_loop(self):
+        while True:
+            with self.condition:
+                while not self.frames and not self.closed:
+                    self.condition.wait()
+                if not self.frames:
+                    break
+                frame = self.frames.popleft()
+                self.writing = True
+            try:
+                self.socket.sendall(frame)
+            except OSError:
+                with self.condition:
+                    self.abort()
+                break
+            with self.condition:
+                self.writing = False
+                self.pending -= len(frame)
+        self.socket.close()
+
+    # drop what is queued and wake the reader of the connection, must hold the condition
+    def abort(self):
+        self.closed = True
+        self.frames.clear()
+        self.condition.notify()
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # the frames already queued are still written, the writer closes the socket after them
+    def close(self):
+        with self.condition:
+            self.closed = True
+            if self.writer is None:
+                self.socket.close()
+            self.condition.notify()
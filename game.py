@@ -4,7 +4,18 @@ import time
 import chess
 import pygame
 import pygame.gfxdraw
-from utility import get_image_resources, Message
+import protocol
+from assets import PIECE_SIZE, SMALL_PIECE_SIZE, RenderAssets, piece_atlas
+from material import CaptureTracker
+from movecache import MoveIndex
+from network import GameConnection, clocks_at
+from render import NETWORK_EVENT, DirtyRegions, post_event, wait_events
+from scheduler import DEFAULT_TIME_CONTROL, time_bonus
+from utility import push_move, Message
+
+# plies between two saved boards of a replay, and plies skipped by the up and down keys
+SNAPSHOT_INTERVAL = 16
+MOVE_JUMP = 10
 
 
 class Game:
@@ -13,32 +24,36 @@ class Game:
         self.state = Message.IN_QUEUE
         self.game_id = -1
         self.is_white = True
-        self.player_time = 60 * 15
-        self.previous_player_time = self.player_time
         self.moves_information = []
-        self.game_time = 60 * 20
         pygame.init()
         self.WIDTH = 650
         self.HEIGHT = 550+70
         self.screen = pygame.display.set_mode([self.WIDTH, self.HEIGHT])
         pygame.display.set_caption('Chess.io')
-        icon = pygame.image.load('img/icon.png')
-        pygame.display.set_icon(icon)
+        self.assets = RenderAssets()
+        pygame.display.set_icon(self.assets.image('img/icon.png'))
         self.timer = pygame.time.Clock()
         self.fps = 60
+        # sleep between frames until something happens instead of drawing at a fixed rate
+        self.frame_skip = True
+        self.dirty = DirtyRegions()
+        self.overlay = None
+        self.inactive = False
         self.selection = ''
 
-        # load in game piece images (queen, king, rook, bishop, knight, pawn) x 2
-        img_resources = get_image_resources()
-        self.piece_size = img_resources['piece_size']
-        self.pawn_size = img_resources['pawn_size']
-        self.small_piece_size = img_resources['small_piece_size']
-        self.piece_images = img_resources['piece_images']
-        self.small_piece_images = img_resources['small_piece_images']
-        self.piece_list = img_resources['piece']
+        # piece images (queen, king, rook, bishop, knight, pawn) x 2, on the board and in the captured columns
+        self.piece_atlas = piece_atlas(PIECE_SIZE)
+        self.small_piece_atlas = piece_atlas(SMALL_PIECE_SIZE)
+        self.small_piece_size = SMALL_PIECE_SIZE
+
+        # the render loop only reads game data from the latest state published by the connection
+        self.connection = GameConnection(client)
+        self.game_state = self.connection.state
 
         # board
-        self.board = chess.Board()
+        self.board = self.game_state.board
+        self.captures = self.game_state.captures
+        self.move_index = MoveIndex()
         self.title_size = 60
 
     @staticmethod
@@ -54,40 +69,72 @@ class Game:
         y = 8 - y
         return f'{x}{y}'
 
-    # draw main game board
-    def draw_board(self):
-        self.draw_grids()
-        self.draw_message_board()
-        self.draw_info_board()
-
-    def draw_grids(self):
-        # all title
-        color = 0
-        for title_index in range(64):
-            col = title_index % 8
-            row = title_index // 8
-            if color == 0:
-                pygame.draw.rect(self.screen, '#ffcf9f', [
-                    col * self.title_size, row * self.title_size,
-                    self.title_size, self.title_size
-                ])
+    def square_rect(self, square: int):
+        x = (7 - chess.square_file(square)) * self.title_size
+        y = (7 - chess.square_rank(square)) * self.title_size
+        return pygame.Rect(x, y, self.title_size, self.title_size)
 
-            else:
-                pygame.draw.rect(self.screen, '#d28c45', [
-                    col * self.title_size, row * self.title_size,
-                    self.title_size, self.title_size
-                ])
-
-            if col % 8 != 7:
-                color = 1 - color
+    def message_board_rect(self):
+        return pygame.Rect(0, self.title_size * 8, self.title_size * 8, self.HEIGHT - self.title_size * 8)
 
-        # make the board grid like
-        for i in range(8):
-            pygame.draw.line(self.screen, 'black', (0, self.title_size * i),
-                             (self.title_size * 8, self.title_size * i), 1)
+    def info_board_rect(self):
+        return pygame.Rect(self.title_size * 8, 0, self.WIDTH - self.title_size * 8, self.HEIGHT)
 
-            pygame.draw.line(self.screen, 'black', (self.title_size * i, 0),
-                             (self.title_size * i, self.title_size * 8), 1)
+    # what is drawn on every square: piece, selection, check, last move, valid move
+    def square_states(self):
+        piece_map = self.board.piece_map()
+        turn_color = 'red' if self.board.turn else 'blue'
+        last_move_color = 'blue' if self.board.turn else 'red'
+        selected = chess.parse_square(self.selection) if self.selection != '' else None
+        destinations = self.valid_destinations(selected)
+        check_square = self.board.king(self.board.turn) if self.board.is_check() else None
+        last_move = self.board.peek() if self.board.move_stack else None
+
+        states = []
+        for square in chess.SQUARES:
+            piece = piece_map.get(square)
+            states.append((
+                piece,
+                turn_color if square == selected and piece else None,
+                square == check_square,
+                last_move_color if last_move and square in (last_move.from_square, last_move.to_square) else None,
+                turn_color if square in destinations else None
+            ))
+        return states
+
+    # all squares the selected piece can move to
+    def valid_destinations(self, selected):
+        if selected is None:
+            return frozenset()
+        return self.move_index.get(self.board).get(selected, frozenset())
+
+    # squares are (rect, state) pairs: empty squares first, all pieces with one blits call, highlights on top
+    def draw_squares(self, squares: list):
+        self.draw_empty_squares([rect for rect, _ in squares])
+        pad = (self.title_size - self.piece_atlas.size) // 2
+        self.piece_atlas.blits(self.screen, [(state[0], (rect.x + pad, rect.y + pad))
+                                             for rect, state in squares if state[0]])
+        for rect, state in squares:
+            self.draw_highlights(rect, state)
+
+    # empty squares with their grid lines, copied from the pre-drawn board
+    def draw_empty_squares(self, rects: list):
+        board = self.assets.board(self.title_size)
+        self.screen.blits([(board, rect, rect) for rect in rects], doreturn=False)
+
+    def draw_highlights(self, rect: pygame.Rect, state: tuple):
+        piece, selected_color, in_check, last_move_color, move_color = state
+        if selected_color:
+            pygame.draw.rect(self.screen, selected_color, rect, 2)
+        if in_check:
+            pygame.draw.rect(self.screen, 'gold', rect, 3)
+        if last_move_color:
+            pygame.draw.rect(self.screen, last_move_color, rect, 3)
+        if move_color:
+            pygame.draw.circle(self.screen, move_color, rect.center, 5)
+
+    def message_board_state(self):
+        return self.board.turn
 
     def draw_message_board(self):
         pygame.draw.rect(self.screen, '#ffcf9f', [
@@ -107,14 +154,30 @@ class Game:
             status_text = 'BLACK TURN'
             color = 'blue'
 
-        font = pygame.font.Font('freesansbold.ttf', 25)
-        text = font.render(status_text, True, color)
+        text = self.assets.text(status_text, 25, color)
         x = (self.title_size * 8 - text.get_width()) // 2
         y = self.title_size * 8 + (self.HEIGHT - self.title_size * 8 - text.get_height()) // 2
         self.screen.blit(text, (x, y))
 
+    # seconds shown on the clocks, they only need a redraw when one of them changes
+    def displayed_clocks(self):
+        clocks = clocks_at(self.game_state, time.monotonic())
+        return int(clocks['game']), int(clocks['white']), int(clocks['black'])
+
+    # ms until the next displayed second, None while the clocks are stopped
+    def next_clock_tick(self):
+        if self.state != Message.READY or self.game_state.winner != '':
+            return None
+        clocks = clocks_at(self.game_state, time.monotonic())
+        turn = 'white' if self.board.turn else 'black'
+        return min(clocks['game'] % 1, clocks[turn] % 1) * 1000 + 1
+
+    def info_board_state(self):
+        return self.is_white, self.displayed_clocks(), self.captures.version
+
     def draw_info_board(self):
         # info board
+        pygame.draw.rect(self.screen, '#ffcf9f', self.info_board_rect())
         pygame.draw.rect(self.screen, 'black', [
             self.title_size * 8, 0,
             self.WIDTH - self.title_size * 8, self.HEIGHT
@@ -127,127 +190,81 @@ class Game:
             color = 'blue'
             player = 'BLACK'
 
-        font = pygame.font.Font('freesansbold.ttf', 15)
-        self.screen.blit(font.render(f'YOU ARE {player}', True, color),
+        self.screen.blit(self.assets.text(f'YOU ARE {player}', 15, color),
                          (self.title_size * 8 + 10, 10))
-        game_time_text = f'Game time: {self.game_time // 60:02d}:{self.game_time % 60:02d}'
-        self.screen.blit(font.render(game_time_text, True, color), (self.title_size * 8 + 10, 30))
-
-        player_time_text = f'Player time: {self.player_time // 60:02d}:{self.player_time % 60:02d}'
-        self.screen.blit(font.render(player_time_text, True, color), (self.title_size * 8 + 10, 50))
+        game_time, white_time, black_time = self.displayed_clocks()
+        player_time = white_time if self.is_white else black_time
+        game_time_text = f'Game time: {game_time // 60:02d}:{game_time % 60:02d}'
+        self.screen.blit(self.assets.text(game_time_text, 15, color), (self.title_size * 8 + 10, 30))
 
-    # draw pieces onto board
-    def draw_pieces(self):
-        self.draw_current_pieces()
-        self.draw_selected_piece()
+        player_time_text = f'Player time: {player_time // 60:02d}:{player_time % 60:02d}'
+        self.screen.blit(self.assets.text(player_time_text, 15, color), (self.title_size * 8 + 10, 50))
         self.draw_captured_pieces()
-        self.draw_check()
-        self.draw_last_move()
-        self.draw_valid_moves()
 
     def draw_captured_pieces(self):
-        white_index = 0
-        black_index = 0
         white_x_coord = ((self.WIDTH - self.title_size * 8) // 2 - self.small_piece_size) // 2 + self.title_size * 8
         black_x_coord = ((self.WIDTH - self.title_size * 8) // 2 - self.small_piece_size) // 2 + \
                         (self.WIDTH - self.title_size * 8) // 2 + self.title_size * 8
         pad_y = 90
-        for pair in self.moves_information:
-            time_to_move, capture_piece = pair
-            if capture_piece is not None:
-                piece_name = capture_piece.symbol()
-                index = self.piece_list.index(piece_name)
-                # if black
-                if piece_name.islower():
-                    y_coord = pad_y + black_index * 30
-                    self.screen.blit(self.small_piece_images[index], (black_x_coord, y_coord))
-                    black_index += 1
-                else:
-                    y_coord = pad_y + white_index * 30
-                    self.screen.blit(self.small_piece_images[index], (white_x_coord, y_coord))
-                    white_index += 1
-
-    def draw_current_pieces(self):
-        piece_map = self.board.piece_map()
-
-        for square, piece in piece_map.items():
-            square_coord = chess.square_name(square)
-            piece_name = piece.symbol()
-            index = self.piece_list.index(piece_name)
-            x_coord, y_coord = self.decode_coordinate(square_coord)
-            pad_x = pad_y = (self.title_size - self.piece_images[index].get_width()) // 2
-            self.screen.blit(self.piece_images[index],
-                             (x_coord * self.title_size + pad_x, y_coord * self.title_size + pad_y))
-
-    def draw_selected_piece(self):
-        try:
-            piece = self.board.piece_at(chess.parse_square(self.selection))
-            if piece:
-                if self.board.turn:
-                    color = 'red'
-                else:
-                    color = 'blue'
-                x, y = self.decode_coordinate(self.selection)
-                pygame.draw.rect(self.screen, color, [
-                    x * self.title_size, y * self.title_size,
-                    self.title_size, self.title_size
-                ], 2)
-        except ValueError:
-            pass
-
-    def draw_check(self):
-        if self.board.is_check():
-            if self.board.turn:
-                king_index = self.board.king(chess.WHITE)
-            else:
-                king_index = self.board.king(chess.BLACK)
-            king_position = chess.square_name(king_index)
-            coord = self.decode_coordinate(king_position)
-            x, y = coord
-            pygame.draw.rect(self.screen, 'gold', [
-                x * self.title_size, y * self.title_size,
-                self.title_size, self.title_size
-            ], 3)
-
-    # draw all possible move of the current selection
-    def draw_valid_moves(self):
-        if self.selection == '':
+        placements = []
+        for index, piece in enumerate(self.captures.captured[chess.WHITE]):
+            placements.append((piece, (white_x_coord, pad_y + index * 30)))
+        for index, piece in enumerate(self.captures.captured[chess.BLACK]):
+            placements.append((piece, (black_x_coord, pad_y + index * 30)))
+        self.small_piece_atlas.blits(self.screen, placements)
+
+        balance = self.captures.balance
+        balance_text = f'Material: {balance:+d}' if balance else 'Material: even'
+        self.screen.blit(self.assets.text(balance_text, 15, 'black'), (self.title_size * 8 + 10, self.HEIGHT - 30))
+
+    # popup drawn over the board: 'waiting', 'inactive' or None
+    def overlay_state(self):
+        if self.state == Message.IN_QUEUE:
+            return 'waiting'
+        if self.inactive:
+            return 'inactive'
+        return None
+
+    def draw_overlay(self, overlay: str):
+        if overlay == 'inactive':
+            self.draw_inactive()
+
+    # redraw only the squares and boards whose content changed since the last frame
+    def render(self):
+        overlay = self.overlay_state()
+        if overlay != self.overlay:
+            self.overlay = overlay
+            self.dirty.invalidate()
+
+        if overlay in ('waiting', 'loading'):
+            if self.dirty.full:
+                self.screen.fill('#ffcf9f')
+                self.draw_waiting('Waiting for opponent' if overlay == 'waiting' else 'Loading game')
+                self.dirty.flush()
             return
 
-        if self.board.turn:
-            color = 'red'
-        else:
-            color = 'blue'
-
-        legal_moves = list(self.board.legal_moves)
-        valid_moves = [str(move) for move in legal_moves if str(move).startswith(self.selection)]
-        valid_coord = [self.decode_coordinate(move[2:]) for move in valid_moves]
-        for coord in valid_coord:
-            x, y = coord
-            pygame.draw.circle(self.screen, color, (
-                x * self.title_size + self.title_size // 2,
-                y * self.title_size + self.title_size // 2
-            ), 5)
-
-    # draw the last move
-    def draw_last_move(self):
-        if self.board.move_stack:
-            last_move = self.board.peek()
-            x_start, y_start = self.decode_coordinate(str(last_move)[:2])
-            x_end, y_end = self.decode_coordinate(str(last_move)[2:])
-            if self.board.turn:
-                color = 'blue'
-            else:
-                color = 'red'
-
-            pygame.draw.rect(self.screen, color, [
-                x_start * self.title_size, y_start * self.title_size,
-                self.title_size, self.title_size
-            ], 3)
-            pygame.draw.rect(self.screen, color, [
-                x_end * self.title_size, y_end * self.title_size,
-                self.title_size, self.title_size
-            ], 3)
+        squares = []
+        for square, state in enumerate(self.square_states()):
+            rect = self.square_rect(square)
+            if self.dirty.update(square, state, rect):
+                squares.append((rect, state))
+        self.draw_squares(squares)
+        if self.dirty.update('message', self.message_board_state(), self.message_board_rect()):
+            self.draw_message_board()
+        if self.dirty.update('info', self.info_board_state(), self.info_board_rect()):
+            self.draw_info_board()
+
+        # the popup is opaque, redrawing it over the changed regions is enough
+        if overlay is not None and self.dirty.rects:
+            self.draw_overlay(overlay)
+        self.dirty.flush()
+
+    # with frame skip the loop sleeps until input, a network update or a clock tick arrives
+    def next_events(self, timeout=None):
+        self.timer.tick(self.fps)
+        if not self.frame_skip:
+            return pygame.event.get()
+        return wait_events(timeout)
 
     def check_promotion(self, move: chess.Move):
         start, end = str(move)[:2], str(move)[2:]
@@ -285,41 +302,39 @@ class Game:
                 self.selection = destination
             else:
                 if self.selection != destination:
-                    legal_moves = set(self.board.legal_moves)
                     move = chess.Move.from_uci(self.selection + destination)
                     if self.check_promotion(move):
                         move = chess.Move.from_uci(str(move) + 'q')
-                    if move in legal_moves:
-                        captured_piece = None
-                        if self.board.is_capture(move):
-                            captured_piece = self.board.piece_at(move.to_square)
-                        self.board.push(move)
-                        self.moves_information.append(
-                            (self.previous_player_time-self.player_time, captured_piece)
-                        )
-                        self.previous_player_time = self.player_time
-                        data = {
-                            'board': self.board,
-                            'moves_information': self.moves_information
-                        }
-                        self.client.send(data)
+                    if move.to_square in self.valid_destinations(move.from_square):
+                        elapsed_ms = int((time.monotonic() - self.game_state.turn_start) * 1000)
+                        ply = len(self.board.move_stack)
+                        self.connection.push_local(move, elapsed_ms)
+                        self.update_game_state()
+                        self.client.send_payload(protocol.encode_move(ply, move, elapsed_ms))
                 self.selection = ''
 
+    @staticmethod
+    def result_text(winner: str):
+        if winner == 'DRAW':
+            return 'Draw!'
+        return f'{winner} won!'
+
     def draw_game_over(self, winner: str, opponent_disconnected=False):
         width, height = 450, 120
         pygame.draw.rect(self.screen, 'black', [(self.WIDTH - width) // 2, (self.HEIGHT - height) // 2, width, height])
 
         if winner == 'WHITE':
             color = 'red'
+        elif winner == 'DRAW':
+            color = 'white'
         else:
             color = 'blue'
 
-        font = pygame.font.Font('freesansbold.ttf', 15)
-        state_text = font.render(f'{winner} won!', True, color)
-        tip_text = font.render('You will be disconnected in 3s', True, 'white')
+        state_text = self.assets.text(self.result_text(winner), 15, color)
+        tip_text = self.assets.text('You will be disconnected in 3s', 15, 'white')
 
         if opponent_disconnected:
-            state_text = font.render(f'{winner} won! Your opponent disconnected', True, color)
+            state_text = self.assets.text(f'{winner} won! Your opponent disconnected', 15, color)
 
         self.screen.blit(state_text, (
             (self.WIDTH - width) // 2 + (width - state_text.get_width()) // 2,
@@ -333,9 +348,8 @@ class Game:
     def draw_out_of_time(self):
         width, height = 450, 120
         pygame.draw.rect(self.screen, 'black', [(self.WIDTH - width) // 2, (self.HEIGHT - height) // 2, width, height])
-        font = pygame.font.Font('freesansbold.ttf', 15)
-        state_text = font.render('You ran out of time', True, 'white')
-        tip_text = font.render('You will be disconnected in 3s', True, 'white')
+        state_text = self.assets.text('You ran out of time', 15, 'white')
+        tip_text = self.assets.text('You will be disconnected in 3s', 15, 'white')
 
         self.screen.blit(state_text, (
             (self.WIDTH - width) // 2 + (width - state_text.get_width()) // 2,
@@ -349,103 +363,69 @@ class Game:
     def draw_inactive(self):
         width, height = 450, 120
         pygame.draw.rect(self.screen, 'black', [(self.WIDTH - width) // 2, (self.HEIGHT - height) // 2, width, height])
-        font = pygame.font.Font('freesansbold.ttf', 25)
-        state_text = font.render("You have been inactive for 5s!", True, 'white')
+        state_text = self.assets.text("You have been inactive for 5s!", 25, 'white')
 
         self.screen.blit(state_text, (
             (self.WIDTH - width) // 2 + (width - state_text.get_width()) // 2,
             (self.HEIGHT - height) // 2 + (height - state_text.get_height()) // 2
         ))
 
-    def draw_waiting(self):
-        background_image = pygame.image.load("img/waiting-background.png")
+    def draw_waiting(self, message='Waiting for opponent'):
+        background_image = self.assets.image('img/waiting-background.png')
         width, height = 320, 40
         self.screen.blit(background_image, (0, 50))
 
         pygame.draw.rect(self.screen, '#ffcf9f', [
             (self.WIDTH - width) // 2, (self.HEIGHT - height) // 2, width, height
         ])
-        font = pygame.font.Font('freesansbold.ttf', 30)
-        text = font.render('Waiting for opponent', True, '#d28c45')
+        text = self.assets.text(message, 30, '#d28c45')
 
         self.screen.blit(text, (
             (self.WIDTH - width) // 2 + (width - text.get_width()) // 2,
             (self.HEIGHT - height) // 2 + (height - text.get_height()) // 2
         ))
 
-    # wait for server to send data
-    def fetch_data(self):
-        while True:
-            try:
-                data = self.client.receive()
-                self.board = data['board']
-                self.is_white = (data['white'] == self.client.client_id)
-                self.state = data['state']
-                self.moves_information = data['moves_information']
-                self.game_time = data['time']['game']
-                if self.is_white:
-                    self.player_time = data['time']['white']
-                else:
-                    self.player_time = data['time']['black']
-            except Exception as er:
-                print(er)
-                break
-
-    def countdown_player(self):
-        while self.player_time != 0:
-            try:
-                if self.state == Message.READY and self.is_white == self.board.turn:
-                    self.player_time -= 1
-                    time.sleep(1)
-            except Exception as er:
-                print(er)
-                break
-
-    def countdown_game(self):
-        while self.game_time != 0:
-            try:
-                if self.state == Message.READY:
-                    self.game_time -= 1
-                    time.sleep(1)
-            except Exception as er:
-                print(er)
-                break
+    # switch to the latest published game state, all fields come from the same update
+    def update_game_state(self):
+        game = self.connection.state
+        if game is self.game_state:
+            return
+        if game.snapshots != self.game_state.snapshots:
+            self.is_white = (game.white == self.client.client_id)
+        self.game_state = game
+        self.board = game.board
+        self.moves_information = game.moves_information
+        self.captures = game.captures
+        self.state = game.state
 
     def run_game(self):
-        data_thread = threading.Thread(target=self.fetch_data, daemon=True)
-        data_thread.start()
-
-        player_timer_thread = threading.Thread(target=self.countdown_player, daemon=True)
-        player_timer_thread.start()
-
-        game_timer_thread = threading.Thread(target=self.countdown_game, daemon=True)
-        game_timer_thread.start()
+        self.connection.start()
 
         last_time_active = pygame.time.get_ticks()
         run = True
         while run:
-            self.timer.tick(self.fps)
-            self.screen.fill('#ffcf9f')
-
+            self.update_game_state()
             # wait for opponent
             if self.state == Message.IN_QUEUE:
                 last_time_active = pygame.time.get_ticks()
-                self.draw_waiting()
-                pygame.display.flip()
-                for event in pygame.event.get():
+                self.render()
+                for event in self.next_events():
                     if event.type == pygame.QUIT:
                         run = False
                 continue
 
             if not self.board.turn == self.is_white:
                 last_time_active = pygame.time.get_ticks()
-
-            self.draw_board()
-            self.draw_pieces()
-
-            # out of time
-            if self.player_time == 0:
-                self.draw_out_of_time()
+            inactive_time = pygame.time.get_ticks() - last_time_active
+            self.inactive = inactive_time >= 5000
+            self.render()
+
+            # out of time, only the server ends a game on time
+            if self.state == Message.READY and self.game_state.winner != '':
+                if self.displayed_clocks()[1 if self.is_white else 2] == 0:
+                    self.draw_out_of_time()
+                else:
+                    self.draw_game_over(self.game_state.winner)
                 pygame.display.flip()
                 pygame.time.wait(3000)
                 for event in pygame.event.get():
@@ -464,9 +444,10 @@ class Game:
                         pass
                 break
 
-            # end game
-            if self.board.is_checkmate():
-                winner = 'BLACK' if self.board.turn else 'WHITE'
+            # end game, checkmate or an automatic draw, the final game data of the server follows
+            outcome = self.board.outcome()
+            if outcome is not None:
+                winner = 'DRAW' if outcome.winner is None else 'WHITE' if outcome.winner else 'BLACK'
                 self.draw_game_over(winner)
                 pygame.display.flip()
                 pygame.time.wait(3000)
@@ -475,8 +456,11 @@ class Game:
                         pass
                 break
 
-            # event handling
-            for event in pygame.event.get():
+            # event handling, wake up in time to show the inactive warning or the next clock second
+            timeout = self.next_clock_tick()
+            if not self.inactive and self.board.turn == self.is_white:
+                timeout = 5000 - inactive_time if timeout is None else min(timeout, 5000 - inactive_time)
+            for event in self.next_events(timeout):
                 if event.type == pygame.QUIT:
                     run = False
 
@@ -494,10 +478,6 @@ class Game:
                 if event.type == pygame.MOUSEMOTION or event.type == pygame.MOUSEWHEEL:
                     last_time_active = pygame.time.get_ticks()
 
-            if pygame.time.get_ticks() - last_time_active >= 5000:
-                self.draw_inactive()
-            pygame.display.flip()
-
         self.client.client_socket.close()
         pygame.quit()
 
@@ -506,55 +486,51 @@ class GameView(Game):
     def __init__(self, client):
         super().__init__(client)
         pygame.display.set_caption('Room View Chess.io')
-        self.data = {}
+
+    def info_board_state(self):
+        return self.game_state.viewers, self.displayed_clocks(), self.captures.version
 
     def draw_info_board(self):
         # info board
+        pygame.draw.rect(self.screen, '#ffcf9f', self.info_board_rect())
         pygame.draw.rect(self.screen, 'black', [
             self.title_size * 8, 0,
             self.WIDTH - self.title_size * 8, self.HEIGHT - (self.HEIGHT - self.title_size * 8)
         ], 1)
 
-        font = pygame.font.Font('freesansbold.ttf', 15)
         self.screen.blit(
-            font.render(f'Current viewers: {self.data["viewers"]}', True, 'black'),
+            self.assets.text(f'Current viewers: {self.game_state.viewers}', 15, 'black'),
             (self.title_size * 8 + 10, 10)
         )
 
-        game_time = self.data['time']['game']
-        white_time = self.data['time']['white']
-        black_time = self.data['time']['black']
+        game_time, white_time, black_time = self.displayed_clocks()
         game_time_text = f'Game time: {game_time // 60:02d}:{game_time % 60:02d}'
-        self.screen.blit(font.render(game_time_text, True, 'black'), (self.title_size * 8 + 10, 30))
+        self.screen.blit(self.assets.text(game_time_text, 15, 'black'), (self.title_size * 8 + 10, 30))
 
         white_time_text = f'White time: {white_time // 60:02d}:{white_time % 60:02d}'
-        self.screen.blit(font.render(white_time_text, True, 'red'), (self.title_size * 8 + 10, 50))
+        self.screen.blit(self.assets.text(white_time_text, 15, 'red'), (self.title_size * 8 + 10, 50))
 
         black_time_text = f'Black time: {black_time // 60:02d}:{black_time % 60:02d}'
-        self.screen.blit(font.render(black_time_text, True, 'blue'), (self.title_size * 8 + 10, 70))
-
-    def draw_pieces(self):
-        self.draw_current_pieces()
+        self.screen.blit(self.assets.text(black_time_text, 15, 'blue'), (self.title_size * 8 + 10, 70))
         self.draw_captured_pieces()
-        self.draw_check()
-        self.draw_last_move()
+
+    # the server pushes moves, viewer counts and game data, nothing is shown until the game data arrived
+    def overlay_state(self):
+        if self.game_state.snapshots == 0:
+            return 'loading'
+        return None
 
     def run_game(self):
+        self.connection.start()
+
         run = True
         while run:
-            self.timer.tick(self.fps)
-            self.screen.fill('#ffcf9f')
-            self.client.send(Message.VIEWING)
-            self.data = self.client.receive()
-
-            self.board = self.data['board']
-            self.moves_information = self.data['moves_information']
-            self.draw_board()
-            self.draw_pieces()
-
-            # game ended
-            if self.data['state'] == Message.DISCONNECT:
-                winner = self.data['winner']
+            self.update_game_state()
+            self.render()
+
+            # game ended, the clocks stopped with the winner
+            if self.state == Message.DISCONNECT or self.game_state.winner != '':
+                winner = self.game_state.winner
                 self.draw_game_over(winner)
                 pygame.display.flip()
                 pygame.time.wait(3000)
@@ -564,26 +540,27 @@ class GameView(Game):
                 break
 
             # event handling
-            for event in pygame.event.get():
+            for event in self.next_events(self.next_clock_tick()):
                 if event.type == pygame.QUIT:
                     run = False
 
-            pygame.display.flip()
-
         self.client.send(Message.STOP_VIEWING)
         pygame.quit()
 
 
 class GameReplay(Game):
-    def __init__(self, client, board: chess.Board, moves_information: list[tuple], winner: str):
+    # plies is the length of a streamed replay, its moves arrive later through fetch_data
+    def __init__(self, client, board: chess.Board, moves_information: list[tuple], winner: str, plies=None,
+                 time_control=DEFAULT_TIME_CONTROL):
         super().__init__(client)
         pygame.display.set_caption('Game Replay Chess.io')
         self.board = chess.Board()
+        self.captures = CaptureTracker()
         self.winner = winner
-        self.move_list = board.move_stack
-        self.moves_information = moves_information
+        self.move_list = []
+        self.moves_information = []
         self.current_move = 0
-        self.max_move = len(self.move_list)
+        self.max_move = len(board.move_stack) if plies is None else plies
         self.autoplay = False
 
         self.previous_button, self.next_button, self.play_button, self.pause_button = self.load_button_image()
@@ -597,38 +574,78 @@ class GameReplay(Game):
         self.x_pause = self.title_size * 8 // 2 - 25
         self.y_pause = self.title_size * 8 + (self.HEIGHT - self.title_size * 8 - 60) // 2 + 20  # pad for text
 
-        self.game_time = 60*20
-        self.white_time = 60*15
-        self.black_time = 60*15
-        self.game_timestamps, self.white_timestamps, self.black_timestamps = self.timestamp_list()
-
-    def timestamp_list(self):
-        game_time = self.game_time
-        white_time = self.white_time
-        black_time = self.black_time
-
-        game = [game_time]
-        white = [white_time]
-        black = [black_time]
-        for index, pair in enumerate(self.moves_information):
-            game_time -= pair[0]
-            if index % 2 == 0:
-                white_time -= pair[0]
+        # scrubber bar under the buttons, click or drag it to jump to any move
+        self.scrubber_rect = pygame.Rect(20, self.HEIGHT - 17, self.title_size * 8 - 40, 6)
+        self.scrubbing = False
+
+        # the clocks after every ply, with the increment or delay of the game given back after each move
+        self.time_control = time_control
+        self.game_time = time_control.game
+        self.white_time = time_control.player
+        self.black_time = time_control.player
+        self.game_timestamps = [self.game_time]
+        self.white_timestamps = [self.white_time]
+        self.black_timestamps = [self.black_time]
+
+        # board and captures after the last loaded move, a snapshot is kept every SNAPSHOT_INTERVAL plies
+        # so seeking never replays more than that
+        self.loaded_board = chess.Board()
+        self.loaded_captures = CaptureTracker()
+        self.snapshots = [(chess.Board(), self.loaded_captures.snapshot())]
+        # number of moves that can be shown, only grows
+        self.loaded = 0
+        self.add_moves([(move, time_to_move) for move, (time_to_move, _) in zip(board.move_stack, moves_information)])
+
+    # append downloaded (move, time to move in ms) pairs, called by the fetch thread while the replay is shown
+    # every list is extended before loaded, so the render loop never sees a partial move
+    def add_moves(self, moves: list):
+        for move, time_to_move in moves:
+            ply = len(self.move_list)
+            push_move(self.loaded_board, self.moves_information, move, time_to_move, self.loaded_captures)
+            self.move_list.append(move)
+            self.game_timestamps.append(self.game_timestamps[-1] - time_to_move / 1000)
+            if ply % 2 == 0:
+                self.white_timestamps.append(self.clock_after_move(self.white_timestamps[-1], time_to_move))
+                self.black_timestamps.append(self.black_timestamps[-1])
             else:
-                black_time -= pair[0]
-            game.append(game_time)
-            white.append(white_time)
-            black.append(black_time)
-        return game, white, black
+                self.white_timestamps.append(self.white_timestamps[-1])
+                self.black_timestamps.append(self.clock_after_move(self.black_timestamps[-1], time_to_move))
+            if (ply + 1) % SNAPSHOT_INTERVAL == 0:
+                # the boards keep only the last moves, enough for the last move highlight and to step back
+                self.snapshots.append((self.loaded_board.copy(stack=SNAPSHOT_INTERVAL),
+                                       self.loaded_captures.snapshot()))
+            self.loaded = ply + 1
+
+    # same as the server clock, a flag that fell is not raised again by the bonus
+    def clock_after_move(self, clock: float, time_to_move: int):
+        spent = time_to_move / 1000
+        remaining = clock - spent
+        return remaining + time_bonus(self.time_control, spent) if remaining > 0 else 0
+
+    # chunks of a streamed replay, until every move arrived
+    def fetch_data(self):
+        while self.loaded < self.max_move:
+            try:
+                chunk = self.client.receive()
+                if chunk is None:
+                    break
+                if isinstance(chunk, protocol.ReplayChunk) and chunk.start == self.loaded:
+                    self.add_moves(chunk.moves)
+                    post_event(NETWORK_EVENT)
+            except Exception as er:
+                print(er)
+                break
 
-    @staticmethod
-    def load_button_image():
-        next_image = pygame.image.load('img/next.png')
-        previous_image = pygame.image.load('img/previous.png')
-        play_image = pygame.image.load('img/play.png')
-        pause_image = pygame.image.load('img/pause.png')
+    def load_button_image(self):
+        next_image = self.assets.image('img/next.png')
+        previous_image = self.assets.image('img/previous.png')
+        play_image = self.assets.image('img/play.png')
+        pause_image = self.assets.image('img/pause.png')
         return previous_image, next_image, play_image, pause_image
 
+    def message_board_state(self):
+        return self.board.turn, self.autoplay, self.current_move, self.loaded
+
     def draw_message_board(self):
         pygame.draw.rect(self.screen, '#ffcf9f', [
             0, self.title_size * 8,
@@ -647,8 +664,7 @@ class GameReplay(Game):
             status_text = 'BLACK TURN'
             color = 'blue'
 
-        font = pygame.font.Font('freesansbold.ttf', 25)
-        text = font.render(status_text, True, color)
+        text = self.assets.text(status_text, 25, color)
         x = (self.title_size * 8 - text.get_width()) // 2
         y = 500
         self.screen.blit(text, (x, y))
@@ -658,40 +674,58 @@ class GameReplay(Game):
             self.screen.blit(self.next_button, (self.x_next, self.y_next))
             self.screen.blit(self.play_button, (self.x_play, self.y_play))
         else:  # Draw disabled buttons if in autoplay mode
-            faded_color = (128, 128, 128, 128)  # Adjust alpha channel for faded appearance
-
-            disabled_previous = self.previous_button.copy()
-            disabled_previous.fill(faded_color, special_flags=pygame.BLEND_RGBA_MULT)
-            self.screen.blit(disabled_previous, (self.x_previous, self.y_previous))
-
-            disabled_next = self.next_button.copy()
-            disabled_next.fill(faded_color, special_flags=pygame.BLEND_RGBA_MULT)
-            self.screen.blit(disabled_next, (self.x_next, self.y_next))
+            self.screen.blit(self.assets.faded_image('img/previous.png'), (self.x_previous, self.y_previous))
+            self.screen.blit(self.assets.faded_image('img/next.png'), (self.x_next, self.y_next))
 
             self.screen.blit(self.pause_button, (self.x_pause, self.y_pause))
+        self.draw_scrubber()
+
+    def draw_scrubber(self):
+        color = 'black' if not self.autoplay else 'gray'
+        pygame.draw.rect(self.screen, '#d28c45', self.scrubber_rect)
+        loaded = self.scrubber_rect.copy()
+        loaded.width = self.scrubber_rect.width * self.loaded // max(1, self.max_move)
+        pygame.draw.rect(self.screen, '#eab37c', loaded)
+        played = self.scrubber_rect.copy()
+        played.width = self.scrubber_rect.width * self.current_move // (self.max_move + 1)
+        pygame.draw.rect(self.screen, color, played)
+        pygame.draw.circle(self.screen, color, (played.right, played.centery), 6)
+
+    # move shown at a point of the scrubber bar
+    def scrubber_move(self, x_cord: int):
+        fraction = (x_cord - self.scrubber_rect.x) / self.scrubber_rect.width
+        return round(max(0.0, min(1.0, fraction)) * (self.max_move + 1))
+
+    def info_board_state(self):
+        return self.current_move, self.game_time, self.white_time, self.black_time, self.captures.version
 
     def draw_info_board(self):
         # info board
+        pygame.draw.rect(self.screen, '#ffcf9f', self.info_board_rect())
         pygame.draw.rect(self.screen, 'black', [
             self.title_size * 8, 0,
             self.WIDTH - self.title_size * 8, self.HEIGHT
         ], 1)
 
-        font = pygame.font.Font('freesansbold.ttf', 15)
-        self.screen.blit(font.render(f'Current move: {self.current_move}', True, 'black'),
+        self.screen.blit(self.assets.text(f'Current move: {self.current_move}', 15, 'black'),
                          (self.title_size * 8 + 10, 10))
-        game_time_text = f'Game time: {self.game_time // 60:02d}:{self.game_time % 60:02d}'
-        self.screen.blit(font.render(game_time_text, True, 'black'), (self.title_size * 8 + 10, 30))
+        game_time, white_time, black_time = int(self.game_time), int(self.white_time), int(self.black_time)
+        game_time_text = f'Game time: {game_time // 60:02d}:{game_time % 60:02d}'
+        self.screen.blit(self.assets.text(game_time_text, 15, 'black'), (self.title_size * 8 + 10, 30))
 
-        white_time_text = f'White time: {self.white_time // 60:02d}:{self.white_time % 60:02d}'
-        self.screen.blit(font.render(white_time_text, True, 'red'), (self.title_size * 8 + 10, 50))
+        white_time_text = f'White time: {white_time // 60:02d}:{white_time % 60:02d}'
+        self.screen.blit(self.assets.text(white_time_text, 15, 'red'), (self.title_size * 8 + 10, 50))
 
-        black_time_text = f'Black time: {self.black_time // 60:02d}:{self.black_time % 60:02d}'
-        self.screen.blit(font.render(black_time_text, True, 'blue'), (self.title_size * 8 + 10, 70))
+        black_time_text = f'Black time: {black_time // 60:02d}:{black_time % 60:02d}'
+        self.screen.blit(self.assets.text(black_time_text, 15, 'blue'), (self.title_size * 8 + 10, 70))
+        self.draw_captured_pieces()
 
     def handle_button_click(self, x_cord: int, y_cord: int):
         if not self.autoplay:  # Allow button clicks only if not in autoplay mode
-            if self.x_previous <= x_cord <= self.x_previous + 50 and self.y_previous \
+            if self.scrubber_rect.inflate(12, 12).collidepoint(x_cord, y_cord):
+                self.scrubbing = True
+                self.seek(self.scrubber_move(x_cord))
+            elif self.x_previous <= x_cord <= self.x_previous + 50 and self.y_previous \
                     <= y_cord <= self.y_previous + 50:
                 self.previous()
             elif self.x_next <= x_cord <= self.x_next + 50 and self.y_next \
@@ -708,54 +742,50 @@ class GameReplay(Game):
     def previous(self):
         if self.current_move == 0:
             return
-
-        self.current_move -= 1
-        # extra last move -> last move => Don't pop
-        if self.current_move != self.max_move:
-            self.game_time = self.game_timestamps[self.current_move]
-            self.white_time = self.white_timestamps[self.current_move]
-            self.black_time = self.black_timestamps[self.current_move]
-            self.board.pop()
+        self.seek(self.current_move - 1)
 
     def next(self):
         if self.current_move == self.max_move+1:
             return
+        self.seek(self.current_move + 1)
+
+    # show any move, max_move+1 is the game over screen after the last move
+    # moves that are not downloaded yet can not be shown, the seek stops at the last loaded one
+    # steps from the current board when it is close, otherwise from the closest snapshot before the move
+    # board.ply() counts from the start position, the move stack of a restored board is partial
+    def seek(self, move: int):
+        loaded = self.loaded
+        move = max(0, min(move, self.max_move + 1 if loaded == self.max_move else loaded))
+        ply = min(move, self.max_move)
+        current = self.board.ply()
+        if current > ply and current - ply <= min(len(self.board.move_stack), SNAPSHOT_INTERVAL):
+            while self.board.ply() > ply:
+                self.board.pop()
+                self.captures.pop()
+        elif not (current <= ply and ply - current <= ply % SNAPSHOT_INTERVAL):
+            board, captures = self.snapshots[ply // SNAPSHOT_INTERVAL]
+            self.board = board.copy()
+            self.captures.restore(captures)
+
+        while self.board.ply() < ply:
+            index = self.board.ply()
+            move_to_push = self.move_list[index]
+            self.captures.push(move_to_push, self.moves_information[index][1], self.board.turn)
+            self.board.push(move_to_push)
+
+        self.current_move = move
+        self.game_time = self.game_timestamps[ply]
+        self.white_time = self.white_timestamps[ply]
+        self.black_time = self.black_timestamps[ply]
+
+    def overlay_state(self):
+        if self.current_move == self.max_move+1:
+            return 'game_over'
+        return None
 
-        self.current_move += 1
-        # last move -> extra last move => Don't push
-        if self.current_move != self.max_move+1:
-            self.game_time = self.game_timestamps[self.current_move]
-            self.white_time = self.white_timestamps[self.current_move]
-            self.black_time = self.black_timestamps[self.current_move]
-            self.board.push(self.move_list[self.current_move - 1])
-
-    def draw_pieces(self):
-        self.draw_current_pieces()
-        self.draw_captured_pieces()
-        self.draw_check()
-        self.draw_last_move()
-
-    def draw_captured_pieces(self):
-        white_index = 0
-        black_index = 0
-        white_x_coord = ((self.WIDTH - self.title_size * 8) // 2 - self.small_piece_size) // 2 + self.title_size * 8
-        black_x_coord = ((self.WIDTH - self.title_size * 8) // 2 - self.small_piece_size) // 2 + \
-                        (self.WIDTH - self.title_size * 8) // 2 + self.title_size * 8
-        pad_y = 90
-        for pair in self.moves_information[:self.current_move]:
-            time_to_move, capture_piece = pair
-            if capture_piece is not None:
-                piece_name = capture_piece.symbol()
-                index = self.piece_list.index(piece_name)
-                # if black
-                if piece_name.islower():
-                    y_coord = pad_y + black_index * 30
-                    self.screen.blit(self.small_piece_images[index], (black_x_coord, y_coord))
-                    black_index += 1
-                else:
-                    y_coord = pad_y + white_index * 30
-                    self.screen.blit(self.small_piece_images[index], (white_x_coord, y_coord))
-                    white_index += 1
+    def draw_overlay(self, overlay: str):
+        if overlay == 'game_over':
+            self.draw_game_over(self.winner)
 
     def draw_game_over(self, winner: str, opponent_disconnected=False):
         width, height = 450, 120
@@ -763,11 +793,12 @@ class GameReplay(Game):
 
         if winner == 'WHITE':
             color = 'red'
+        elif winner == 'DRAW':
+            color = 'white'
         else:
             color = 'blue'
 
-        font = pygame.font.Font('freesansbold.ttf', 20)
-        state_text = font.render(f'{winner} won!', True, color)
+        state_text = self.assets.text(self.result_text(winner), 20, color)
 
         self.screen.blit(state_text, (
             (self.WIDTH - width) // 2 + (width - state_text.get_width()) // 2,
@@ -775,23 +806,20 @@ class GameReplay(Game):
         ))
 
     def run_game(self):
-        run = True
+        if self.loaded < self.max_move:
+            data_thread = threading.Thread(target=self.fetch_data, daemon=True)
+            data_thread.start()
 
+        run = True
         previous_time = pygame.time.get_ticks()
         while run:
-            self.timer.tick(self.fps)
-            self.screen.fill('#ffcf9f')
-
-            self.draw_board()
-            self.draw_pieces()
-
-            if self.current_move == self.max_move+1:
-                self.draw_game_over(self.winner)
+            self.render()
 
             if pygame.time.get_ticks() - previous_time >= 1000:
                 previous_time = pygame.time.get_ticks()
-                if self.autoplay:
-                    next_move = self.current_move + 1
+                next_move = self.current_move + 1
+                # a streamed replay waits here until the next move is downloaded
+                if self.autoplay and not self.loaded < next_move <= self.max_move:
                     if next_move != self.max_move + 1:
                         if self.current_move % 2 == 0:
                             self.white_time -= 1
@@ -803,10 +831,13 @@ class GameReplay(Game):
                         pygame.time.wait(500)
                         self.autoplay = False
                         self.next()
-                    elif self.game_time == self.game_timestamps[next_move]:
+                    elif self.game_time <= self.game_timestamps[next_move]:
                         self.next()
+                    continue
 
-            for event in pygame.event.get():
+            # while paused nothing changes until the next input
+            timeout = 1000 - (pygame.time.get_ticks() - previous_time) if self.autoplay else None
+            for event in self.next_events(timeout):
                 if event.type == pygame.QUIT:
                     run = False
 
@@ -815,14 +846,26 @@ class GameReplay(Game):
                     y_cord = event.pos[1]
                     self.handle_button_click(x_cord, y_cord)
 
+                elif event.type == pygame.MOUSEMOTION and self.scrubbing:
+                    self.seek(self.scrubber_move(event.pos[0]))
+
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    self.scrubbing = False
+
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_RIGHT and not self.autoplay:
                         self.next()
                     elif event.key == pygame.K_LEFT and not self.autoplay:
                         self.previous()
+                    elif event.key == pygame.K_UP and not self.autoplay:
+                        self.seek(self.current_move + MOVE_JUMP)
+                    elif event.key == pygame.K_DOWN and not self.autoplay:
+                        self.seek(self.current_move - MOVE_JUMP)
+                    elif event.key == pygame.K_HOME and not self.autoplay:
+                        self.seek(0)
+                    elif event.key == pygame.K_END and not self.autoplay:
+                        self.seek(self.max_move)
                     elif event.key == pygame.K_SPACE:
                         self.autoplay = not self.autoplay  # Toggle autoplay on/off
 
-            pygame.display.flip()
-
         pygame.quit()
@@ -1,11 +1,110 @@
+import bisect
 import datetime
+import queue
 import threading
 import tkinter as tk
+
+import chess
+
 from client import Client
 from game import Game, GameView, GameReplay
 
 from utility import Message
 
+# buttons per row of the room and replay browsers
+GRID_COLUMNS = 5
+# canvas position of the top left corner of the button grid
+GRID_ORIGIN = (-320, -250)
+# rows of buttons kept above and below the visible ones
+GRID_SPARE_ROWS = 1
+# replays asked from the server at once while scrolling the replay browser
+REPLAY_PAGE_SIZE = 50
+# ms between two looks for fetched replay pages, only while a page is on its way
+PAGE_POLL_MS = 50
+
+
+# a scrollable grid of buttons on a canvas, only the cells in sight have a button and buttons are reused
+# while scrolling, cell(index) gives (key, text, command) of a cell or None for an empty one, and a button
+# only changes when its key or text changed
+class ButtonGrid:
+    def __init__(self, canvas: tk.Canvas, cell):
+        self.canvas = canvas
+        self.cell = cell
+        self.size = 0
+        # cell index -> [button, canvas window, key, text] of every cell that has a button
+        self.buttons = {}
+        # (button, canvas window) pairs scrolled out of sight, reused before new ones are made
+        self.spare_buttons = []
+
+        # size of one cell with its padding, from a button like the grid buttons
+        probe = tk.Button(self.canvas, text="Game\nDate\nTime", width=14, height=5, relief=tk.GROOVE)
+        self.cell_width = probe.winfo_reqwidth() + 20
+        self.cell_height = probe.winfo_reqheight() + 20
+        probe.destroy()
+
+    def show(self, size: int):
+        self.size = size
+        self.update_scroll_region()
+        self.update()
+
+    # buttons for the cells in sight, cells scrolled away give their button back
+    def update(self):
+        first, last = self.visible_cells()
+        for index in [index for index in self.buttons if not first <= index < last]:
+            self.release(index)
+
+        for index in range(first, last):
+            cell = self.cell(index)
+            if cell is None:
+                if index in self.buttons:
+                    self.release(index)
+                continue
+            key, text, command = cell
+            cell_button = self.buttons.get(index)
+            if cell_button is None:
+                cell_button = self.buttons[index] = self.place_button(index)
+            if cell_button[2] != key or cell_button[3] != text:
+                cell_button[0].config(text=text, command=command)
+                cell_button[2:] = key, text
+
+    def release(self, index: int):
+        button, window, _, _ = self.buttons.pop(index)
+        self.canvas.itemconfigure(window, state=tk.HIDDEN)
+        self.spare_buttons.append((button, window))
+
+    def place_button(self, index: int):
+        row, col = divmod(index, GRID_COLUMNS)
+        x = GRID_ORIGIN[0] + 10 + col * self.cell_width
+        y = GRID_ORIGIN[1] + 10 + row * self.cell_height
+        if self.spare_buttons:
+            button, window = self.spare_buttons.pop()
+            self.canvas.coords(window, x, y)
+            self.canvas.itemconfigure(window, state=tk.NORMAL)
+        else:
+            button = tk.Button(self.canvas, width=14, height=5, cursor='hand2', fg='white', bg='#3e8ed0',
+                               activeforeground='white', activebackground='#3e8ed0', relief=tk.GROOVE)
+            window = self.canvas.create_window((x, y), window=button, anchor="nw")
+        return [button, window, None, None]
+
+    # first and last (excluded) index of the cells to show
+    def visible_cells(self):
+        top = self.canvas.canvasy(0) - GRID_ORIGIN[1]
+        height = int(self.canvas.cget('height'))
+        first_row = max(0, int(top // self.cell_height) - GRID_SPARE_ROWS)
+        last_row = int((top + height) // self.cell_height) + GRID_SPARE_ROWS
+        return min(self.size, first_row * GRID_COLUMNS), min(self.size, (last_row + 1) * GRID_COLUMNS)
+
+    # the grid is as high as all cells together, even though most of them have no button
+    def update_scroll_region(self):
+        width, height = int(self.canvas.cget('width')), int(self.canvas.cget('height'))
+        rows = -(-self.size // GRID_COLUMNS)
+        bottom = max(height // 2, GRID_ORIGIN[1] + 10 + rows * self.cell_height)
+        self.canvas.configure(scrollregion=(-width // 2, -height // 2, width // 2, bottom))
+
+    def scroll(self, event):
+        self.canvas.yview_scroll(-1 * (event.delta // 120), "units")
+        self.update()
+
 
 class Home:
     def __init__(self):
@@ -91,7 +190,11 @@ class Home:
 
 class View:
     def __init__(self, client):
-        self.room_data = []
+        # game id -> viewers, the room ids in the order they are shown and the version of the server list
+        self.rooms = {}
+        self.room_ids = []
+        self.room_version = 0
+        self.grid = None
         self.client = client
         self.selection = Message.NO_SELECTION
 
@@ -111,7 +214,6 @@ class View:
                                 highlightthickness=1, highlightbackground="black", bg='#ffcf9f')
         self.background_image = tk.PhotoImage(file="img/canvas-background.png", master=self.canvas)
         self.background = self.canvas.create_image((0, 0), image=self.background_image)
-        self.room_frame = tk.Frame(self.canvas, bg='#ffcf9f')
 
     def init_window(self):
         self.root.resizable(False, False)
@@ -119,39 +221,42 @@ class View:
         self.center_window()
         self.init_canvas()
 
-    def create_rooms(self):
-        for index, data in enumerate(self.room_data):
-            game_id, viewers = data[0], data[1]
-            row = index // 5
-            col = index % 5
-            button = tk.Button(self.room_frame, text=f"Room: {game_id}\nWatching: {viewers}", width=14, height=5,
-                               command=lambda m=game_id: self.view(m), cursor='hand2', fg='white', bg='#3e8ed0',
-                               activeforeground='white', activebackground='#3e8ed0', relief=tk.GROOVE)
-            button.grid(row=row, column=col, padx=10, pady=10)
+    def room_cell(self, index: int):
+        game_id = self.room_ids[index]
+        return game_id, f"Room: {game_id}\nWatching: {self.rooms[game_id]}", lambda: self.view(game_id)
 
     def init_canvas(self):
-        # Create a frame to hold the room buttons
         self.refresh_button.pack(pady=(10, 0))
         self.canvas.pack(padx=0, pady=10)
-        self.canvas.create_window((-320, -250), window=self.room_frame, anchor="nw")
 
         # ------------------
-        self.create_rooms()
+        self.grid = ButtonGrid(self.canvas, self.room_cell)
+        self.grid.show(len(self.room_ids))
         # ------------------
 
         # Bind the canvas to the mousewheel for scrolling
-        self.canvas.bind_all("<MouseWheel>", lambda event: self.canvas.yview_scroll(-1 * (event.delta // 120), "units"))
-
-        # Update the canvas scroll region
-        self.room_frame.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self.canvas.bind_all("<MouseWheel>", self.grid.scroll)
 
+    # the server only sends the rooms added, removed or changed since the last refresh
     def get_data(self):
-        self.client.send(Message.ALL_DATA)
-        self.room_data = self.client.receive()
-        for widget in self.room_frame.winfo_children():
-            widget.destroy()
-        self.create_rooms()
+        self.client.send({'rooms': self.room_version})
+        self.apply_room_changes(self.client.receive())
+        self.grid.show(len(self.room_ids))
+
+    def apply_room_changes(self, changes: dict):
+        if changes['full']:
+            self.rooms = dict(changes['rooms'])
+            self.room_ids = sorted(self.rooms)
+        else:
+            for game_id in changes['removed']:
+                if game_id in self.rooms:
+                    del self.rooms[game_id]
+                    del self.room_ids[bisect.bisect_left(self.room_ids, game_id)]
+            for game_id, viewers in changes['rooms']:
+                if game_id not in self.rooms:
+                    bisect.insort(self.room_ids, game_id)
+                self.rooms[game_id] = viewers
+        self.room_version = changes['version']
 
     def view(self, game_id: int):
         thread = threading.Thread(target=self.view_game, args=(game_id,))
@@ -175,9 +280,30 @@ class View:
 
 class Replay:
     def __init__(self, client):
-        self.game_data = []
         self.client = client
         self.selection = Message.NO_SELECTION
+        self.page_size = REPLAY_PAGE_SIZE
+        self.total = 0
+        # page number -> replay names on it, pages are asked for when they scroll into sight
+        self.pages = {}
+        # replay name -> button text, a replay never changes so this is kept across refreshes
+        self.replay_texts = {}
+        # (timestamp, name) of the newest replay at the last refresh, newer replays wait for the next refresh
+        # so the pages do not shift while scrolling
+        self.newest = None
+        self.grid = None
+        # pages are fetched by one thread so the window never waits for the server, the pages come back
+        # through a queue the window polls, pages of an older refresh are dropped
+        self.page_requests = queue.Queue()
+        self.page_results = queue.Queue()
+        self.loading = set()
+        self.generation = 0
+        self.polling = False
+        # the old pages stay in sight until the first page of a refresh arrives
+        self.refreshing = False
+        # held for every exchange with the server, the replay waits for a page still on its way
+        self.client_lock = threading.Lock()
+        self.closed = False
 
         self.window_width = 700
         self.window_height = 600
@@ -195,7 +321,6 @@ class Replay:
                                 highlightthickness=1, highlightbackground="black", bg='#ffcf9f')
         self.background_image = tk.PhotoImage(file="img/canvas-background.png", master=self.canvas)
         self.background = self.canvas.create_image((0, 0), image=self.background_image)
-        self.room_frame = tk.Frame(self.canvas, bg='#ffcf9f')
 
     def init_window(self):
         self.root.resizable(False, False)
@@ -203,55 +328,127 @@ class Replay:
         self.center_window()
         self.init_canvas()
 
-    def create_games(self):
-        for index, data in enumerate(self.game_data):
-            day, hour, game_id = data.split('_')
-            timestamp = datetime.datetime.strptime(day+' '+hour, "%d-%m-%Y %H-%M-%S")
-
-            row = index // 5
-            col = index % 5
-            text = f"Game: {game_id}\nDate: {timestamp.strftime('%d/%m/%Y')}" \
-                   f"\nTime: {timestamp.strftime('%H:%M:%S')}"
-
-            button = tk.Button(self.room_frame, text=text, width=14, height=5,
-                               command=lambda m=(game_id, day, hour): self.replay(*m),
-                               cursor='hand2', fg='white', bg='#3e8ed0', relief=tk.GROOVE,
-                               activeforeground='white', activebackground='#3e8ed0')
-            button.grid(row=row, column=col, padx=10, pady=10)
+    def replay_cell(self, index: int):
+        page, offset = divmod(index, self.page_size)
+        names = self.pages.get(page)
+        if names is None:
+            if not self.refreshing:
+                self.request_page(page)
+            return index, 'Loading...', lambda: None
+        # replays deleted since the refresh leave the last cells empty
+        if offset >= len(names):
+            return None
+        name = names[offset]
+        return name, self.replay_texts[name], lambda: self.replay(name)
 
     def init_canvas(self):
-        # Create a frame to hold the room buttons
         self.refresh_button.pack(pady=(10, 0))
         self.canvas.pack(padx=0, pady=10)
-        self.canvas.create_window((-320, -250), window=self.room_frame, anchor="nw")
 
         # ------------------
-        self.create_games()
+        self.grid = ButtonGrid(self.canvas, self.replay_cell)
+        self.grid.show(self.total)
         # ------------------
 
         # Bind the canvas to the mousewheel for scrolling
-        self.canvas.bind_all("<MouseWheel>", lambda event: self.canvas.yview_scroll(-1 * (event.delta // 120), "units"))
+        self.canvas.bind_all("<MouseWheel>", self.grid.scroll)
 
-        # Update the canvas scroll region
-        self.room_frame.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        threading.Thread(target=self.fetch_pages, daemon=True).start()
 
+    # the server sends one page of replays at a time, the first one gives the number of replays
+    # and the others are only asked for when they are scrolled to
     def get_data(self):
-        self.client.send(Message.ALL_DATA)
-        self.game_data = self.client.receive()
-        for widget in self.room_frame.winfo_children():
-            widget.destroy()
-        self.create_games()
-
-    def replay(self, game_id: str, day: str, hour: str):
-        thread = threading.Thread(target=self.replay_game, args=(game_id, day, hour))
+        self.generation += 1
+        self.loading = set()
+        self.newest = None
+        self.refreshing = True
+        self.request_page(0)
+
+    def request_page(self, page: int):
+        if page in self.loading:
+            return
+        self.loading.add(page)
+        self.page_requests.put((self.generation, page, self.newest))
+        if not self.polling:
+            self.polling = True
+            self.root.after(PAGE_POLL_MS, self.check_pages)
+
+    # runs on its own thread, one request at a time
+    def fetch_pages(self):
+        while True:
+            request = self.page_requests.get()
+            if request is None:
+                break
+            generation, page, newest = request
+            if generation != self.generation:
+                continue
+            query = {'page': page, 'page_size': self.page_size}
+            if newest is not None:
+                query['before'] = newest
+            with self.client_lock:
+                if self.closed:
+                    break
+                self.client.send(query)
+                data = self.client.receive()
+            if data is None:
+                break
+            self.page_results.put((generation, page, data))
+
+    # runs on the Tk thread, the page of a refresh gives the number of replays
+    def check_pages(self):
+        resized = changed = False
+        while True:
+            try:
+                generation, page, data = self.page_results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                continue
+            self.loading.discard(page)
+            if self.refreshing:
+                self.refreshing = False
+                self.pages = {}
+                self.total = data['total']
+                if data['games']:
+                    self.newest = data['games'][0]['timestamp'], data['games'][0]['name']
+                resized = True
+            self.add_page(page, data['games'])
+            changed = True
+
+        if resized:
+            self.grid.show(self.total)
+        elif changed:
+            self.grid.update()
+
+        if self.loading:
+            self.root.after(PAGE_POLL_MS, self.check_pages)
+        else:
+            self.polling = False
+
+    def add_page(self, page: int, games: list):
+        names = []
+        for game in games:
+            name = game['name']
+            if name not in self.replay_texts:
+                timestamp = datetime.datetime.fromtimestamp(game['timestamp'])
+                self.replay_texts[name] = f"Game: {game['game_id']}\nDate: {timestamp.strftime('%d/%m/%Y')}" \
+                                          f"\nTime: {timestamp.strftime('%H:%M:%S')}"
+            names.append(name)
+        self.pages[page] = names
+
+    def replay(self, replay_name: str):
+        self.page_requests.put(None)
+        thread = threading.Thread(target=self.replay_game, args=(replay_name,))
         thread.start()
         self.root.destroy()
 
-    def replay_game(self, game_id: str, day: str, hour: str):
-        self.client.send(f'{day}_{hour}_{game_id}')
-        data = self.client.receive()
-        replay = GameReplay(self.client, data['board'], data['moves_information'], data['winner'])
+    # the moves are streamed, the replay opens as soon as the header arrives
+    def replay_game(self, replay_name: str):
+        with self.client_lock:
+            self.closed = True
+            self.client.send({'replay': replay_name})
+            header = self.client.receive()
+        replay = GameReplay(self.client, chess.Board(), [], header['winner'], header['plies'], header['time_control'])
         replay.run_game()
 
     def center_window(self):
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import deque
+
+
+# waiting players in arrival order, consumers sleep on a condition until somebody is enqueued
+class MatchmakingQueue:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.players = deque()
+        self.enqueue_time = {}
+        # ---------------------------------------
+        self.num_matched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def __len__(self):
+        return len(self.players)
+
+    def __contains__(self, player_id: int):
+        return player_id in self.enqueue_time
+
+    def append(self, player_id: int):
+        with self.condition:
+            self.players.append(player_id)
+            self.enqueue_time[player_id] = time.monotonic()
+            if len(self.players) >= 2:
+                self.condition.notify()
+
+    # return False if the player was already taken out of the queue (matched or removed)
+    def remove(self, player_id: int):
+        with self.condition:
+            if player_id not in self.enqueue_time:
+                return False
+            self.players.remove(player_id)
+            self.enqueue_time.pop(player_id)
+            return True
+
+    # take every complete pair of waiting players in one pass, first come first served
+    # block until at least one pair is available unless block is False
+    def pop_pairs(self, block=True, timeout=None):
+        with self.condition:
+            if block:
+                self.condition.wait_for(lambda: len(self.players) >= 2, timeout)
+
+            pairs = []
+            now = time.monotonic()
+            while len(self.players) >= 2:
+                white = self.players.popleft()
+                black = self.players.popleft()
+                self.record_wait(now - self.enqueue_time.pop(white))
+                self.record_wait(now - self.enqueue_time.pop(black))
+                pairs.append((white, black))
+            return pairs
+
+    def record_wait(self, wait: float):
+        self.num_matched += 1
+        self.total_wait += wait
+        self.last_wait = wait
+        self.max_wait = max(self.max_wait, wait)
+
+    # queue depth and time-to-match in seconds
+    def metrics(self):
+        with self.condition:
+            now = time.monotonic()
+            oldest_wait = now - self.enqueue_time[self.players[0]] if self.players else 0.0
+            return {
+                'depth': len(self.players),
+                'oldest_wait': oldest_wait,
+                'matched': self.num_matched,
+                'average_wait': self.total_wait / self.num_matched if self.num_matched else 0.0,
+                'max_wait': self.max_wait,
+                'last_wait': self.last_wait
+            }
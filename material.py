@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+import chess
+
+# read-only copy of a tracker, with the same fields the info board draws from
+CaptureView = namedtuple('CaptureView', ['captured', 'balance', 'version'])
+
+PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+    chess.KING: 0
+}
+
+
+# captured pieces of both colors and the material balance, updated on every push and pop of a move
+class CaptureTracker:
+    def __init__(self):
+        # captured pieces of each color in capture order, at most 15 each
+        self.captured = {chess.WHITE: [], chess.BLACK: []}
+        # white material minus black material
+        self.balance = 0
+        # (captured piece, balance change) of every ply, needed to undo it
+        self.history = []
+        # changes whenever the captured pieces or the balance change, cheap to compare for redraws
+        self.version = 0
+
+    # turn is the side that made the move
+    def push(self, move: chess.Move, captured_piece, turn: bool):
+        sign = 1 if turn == chess.WHITE else -1
+        change = 0
+        if captured_piece is not None:
+            self.captured[captured_piece.color].append(captured_piece)
+            change += sign * PIECE_VALUES[captured_piece.piece_type]
+        if move.promotion:
+            change += sign * (PIECE_VALUES[move.promotion] - PIECE_VALUES[chess.PAWN])
+        self.balance += change
+        self.history.append((captured_piece, change))
+        self.version += 1
+
+    def pop(self):
+        captured_piece, change = self.history.pop()
+        if captured_piece is not None:
+            self.captured[captured_piece.color].pop()
+        self.balance -= change
+        self.version += 1
+
+    # start over from a whole game, used when the server sends a new snapshot
+    def reset(self, moves: list, moves_information: list):
+        self.captured = {chess.WHITE: [], chess.BLACK: []}
+        self.balance = 0
+        self.history = []
+        turn = chess.WHITE
+        for move, (_, captured_piece) in zip(moves, moves_information):
+            self.push(move, captured_piece, turn)
+            turn = not turn
+        self.version += 1
+
+    # immutable copy of the current state, for replay seeking
+    def snapshot(self):
+        return (tuple(self.captured[chess.WHITE]), tuple(self.captured[chess.BLACK]), self.balance,
+                tuple(self.history))
+
+    # copy that can be handed to another thread, nothing in it changes later
+    def view(self):
+        return CaptureView({chess.WHITE: tuple(self.captured[chess.WHITE]),
+                            chess.BLACK: tuple(self.captured[chess.BLACK])}, self.balance, self.version)
+
+    def restore(self, snapshot: tuple):
+        white, black, self.balance, history = snapshot
+        self.captured = {chess.WHITE: list(white), chess.BLACK: list(black)}
+        self.history = list(history)
+        self.version += 1
+
+    def __len__(self):
+        return len(self.history)
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+import chess
+
+# positions kept by the shared cache, one takes a few KB
+CACHE_SIZE = 4096
+# only positions up to this ply are cached, later ones are almost never reached by two games
+OPENING_PLIES = 20
+
+# everything about a position that does not depend on how it was reached
+PositionInfo = namedtuple('PositionInfo', ['legal_moves', 'is_check', 'insufficient_material'])
+
+
+# same fields python-chess uses to compare positions for repetitions
+def position_key(board: chess.Board):
+    return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+            board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK], board.turn,
+            board.clean_castling_rights(), board.ep_square if board.has_legal_en_passant() else None)
+
+
+# legal moves per position, shared by every game so common openings are generated once
+# positions after max_plies are built every time, max_plies None caches every position
+class LegalMoveCache:
+    def __init__(self, max_size=CACHE_SIZE, max_plies=OPENING_PLIES):
+        self.max_size = max_size
+        self.max_plies = max_plies
+        self.positions = OrderedDict()
+        self.lock = threading.Lock()
+        # ---------------------------------------
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, board: chess.Board):
+        if self.max_plies is not None and board.ply() > self.max_plies:
+            with self.lock:
+                self.misses += 1
+            return self.build(board)
+        key = position_key(board)
+        with self.lock:
+            info = self.positions.get(key)
+            if info is not None:
+                self.positions.move_to_end(key)
+                self.hits += 1
+                return info
+            self.misses += 1
+
+        info = self.build(board)
+        with self.lock:
+            self.positions[key] = info
+            if len(self.positions) > self.max_size:
+                self.positions.popitem(last=False)
+        return info
+
+    def build(self, board: chess.Board):
+        return PositionInfo(frozenset(board.legal_moves), board.is_check(), board.is_insufficient_material())
+
+    def metrics(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'positions': len(self.positions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0
+            }
+
+
+# from square -> destination squares of the legal moves, enough to highlight and validate a click
+# one per client, the positions of its own game are all worth keeping
+class MoveIndex(LegalMoveCache):
+    def __init__(self, max_size=4096):
+        super().__init__(max_size, max_plies=None)
+
+    def build(self, board: chess.Board):
+        index = {}
+        for move in board.legal_moves:
+            index.setdefault(move.from_square, set()).add(move.to_square)
+        return {square: frozenset(destinations) for square, destinations in index.items()}
+
+
+# winner of a finished game ('WHITE', 'BLACK' or 'DRAW'), '' while it goes on
+# only the automatic endings, claimable draws need a player to ask for them
+def game_result(board: chess.Board, info: PositionInfo):
+    if not info.legal_moves:
+        if info.is_check:
+            return 'BLACK' if board.turn else 'WHITE'
+        return 'DRAW'
+    if info.insufficient_material or board.is_seventyfive_moves() or board.is_fivefold_repetition():
+        return 'DRAW'
+    return ''
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import namedtuple
+
+import chess
+import protocol
+import scheduler
+from material import CaptureTracker
+from render import NETWORK_EVENT, post_event
+from utility import push_move, Message
+
+# everything the render loop needs about a game, a new one is made for every update and never changed
+GameState = namedtuple('GameState', [
+    'version',           # number of updates published so far
+    'snapshots',         # number of full game data messages received, 0 until the game data arrives
+    'board',
+    'moves_information',
+    'captures',
+    'state',
+    'white',
+    'black',
+    'winner',
+    'viewers',
+    'time',              # seconds left {'game', 'white', 'black'} at time_reference
+    'time_reference',    # time.monotonic() of the last clock sync or move
+    'time_control',
+    'turn_start',        # time.monotonic() of the last move
+    'connected'
+])
+
+
+def initial_state():
+    control = scheduler.DEFAULT_TIME_CONTROL
+    now = time.monotonic()
+    return GameState(0, 0, chess.Board(), (), CaptureTracker().view(), Message.IN_QUEUE, None, None, '', 0,
+                     {'game': control.game, 'white': control.player, 'black': control.player}, now, control, now,
+                     True)
+
+
+# clocks of a game at now, interpolated from the last sync, the side to move counts down while the game runs
+# the server decides when a flag falls, a clock only stops at zero here
+def clocks_at(game: GameState, now: float):
+    clocks = dict(game.time)
+    if game.state == Message.READY and game.winner == '':
+        elapsed = now - game.time_reference
+        turn = 'white' if game.board.turn else 'black'
+        clocks['game'] = max(0.0, clocks['game'] - elapsed)
+        clocks[turn] = max(0.0, clocks[turn] - elapsed)
+    return clocks
+
+
+# reads and decodes server messages on its own thread and publishes each result as a new GameState
+# publishing is one reference assignment, the render loop reads state once per frame and never waits on the socket
+class GameConnection:
+    def __init__(self, client):
+        self.client = client
+        self.state = initial_state()
+        # the receive thread and moves played on this client both publish, one at a time
+        self.lock = threading.Lock()
+        # only used under the lock, every published state gets a view of it
+        self.captures = CaptureTracker()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.receive_loop, daemon=True)
+        self.thread.start()
+
+    def receive_loop(self):
+        while True:
+            try:
+                data = self.client.receive()
+                if data is None:
+                    break
+                self.handle(data)
+            except Exception as er:
+                print(er)
+                break
+        with self.lock:
+            self.publish(connected=False)
+        post_event(NETWORK_EVENT)
+
+    def handle(self, data):
+        with self.lock:
+            if isinstance(data, protocol.MoveMessage):
+                # skip moves that are already on the board, own moves and moves of the first game data
+                if data.ply < len(self.state.board.move_stack):
+                    return
+                self.push(data.move, data.elapsed_ms)
+            elif isinstance(data, protocol.ClockSync):
+                # a sync sent before a move that is already on this board would turn back the clocks
+                if data.ply != len(self.state.board.move_stack):
+                    return
+                self.publish(time={'game': data.game_ms / 1000, 'white': data.white_ms / 1000,
+                                   'black': data.black_ms / 1000}, time_reference=time.monotonic())
+            elif isinstance(data, protocol.ViewersMessage):
+                self.publish(viewers=data.viewers)
+            elif isinstance(data, dict):
+                now = time.monotonic()
+                self.captures.reset(data['board'].move_stack, data['moves_information'])
+                self.publish(snapshots=self.state.snapshots + 1, board=data['board'],
+                             moves_information=tuple(data['moves_information']), captures=self.captures.view(),
+                             state=data['state'], white=data['white'], black=data['black'], winner=data['winner'],
+                             viewers=data['viewers'], time={kind: float(value) for kind, value in data['time'].items()},
+                             time_reference=now,
+                             time_control=data.get('time_control', scheduler.DEFAULT_TIME_CONTROL), turn_start=now)
+            else:
+                return
+        post_event(NETWORK_EVENT)
+
+    # a move played on this client, published right away without waiting for the server
+    def push_local(self, move: chess.Move, elapsed_ms: int):
+        with self.lock:
+            self.push(move, elapsed_ms)
+            return self.state
+
+    # the published board is never touched, the move goes onto a copy
+    # the mover gets the increment or delay right away, the server sync after the move confirms it
+    def push(self, move: chess.Move, elapsed_ms: int):
+        now = time.monotonic()
+        game = self.state
+        board = game.board.copy()
+        moves_information = list(game.moves_information)
+        push_move(board, moves_information, move, elapsed_ms, self.captures)
+        clocks = clocks_at(game, now)
+        mover = 'white' if game.board.turn else 'black'
+        if game.state == Message.READY and clocks[mover] > 0:
+            clocks[mover] += scheduler.time_bonus(game.time_control, elapsed_ms / 1000)
+        self.publish(board=board, moves_information=tuple(moves_information), captures=self.captures.view(),
+                     time=clocks, time_reference=now, turn_start=now)
+
+    # must hold the lock
+    def publish(self, **changes):
+        self.state = self.state._replace(version=self.state.version + 1, **changes)
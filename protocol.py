@@ -0,0 +1,94 @@
+import pickle
+import struct
+from collections import namedtuple
+
+import chess
+
+# binary messages start with the protocol version, pickled messages always start with the PROTO opcode
+PROTOCOL_VERSION = 1
+PICKLE_PROTO = 0x80
+
+# message types
+MOVE = 1
+VIEWERS = 2
+REPLAY_CHUNK = 3
+CLOCK_SYNC = 4
+
+HEADER = struct.Struct('>BB')
+# ply index, from square, to square, promotion piece type (0 = none), elapsed time of the move in ms
+MOVE_BODY = struct.Struct('>HBBBI')
+# current number of viewers of the game
+VIEWERS_BODY = struct.Struct('>I')
+# first ply of the chunk, number of plies, followed by one PACKED_MOVE per ply
+REPLAY_CHUNK_BODY = struct.Struct('>HH')
+# packed move (from | to << 6 | promotion << 12), time spent on the move in ms, also the replay store format
+PACKED_MOVE = struct.Struct('>HI')
+# number of moves played, remaining ms of the game, white and black clocks when the message was sent
+CLOCK_SYNC_BODY = struct.Struct('>HIII')
+
+MoveMessage = namedtuple('MoveMessage', ['ply', 'move', 'elapsed_ms'])
+ViewersMessage = namedtuple('ViewersMessage', ['viewers'])
+# moves is a list of (move, elapsed ms)
+ReplayChunk = namedtuple('ReplayChunk', ['start', 'moves'])
+ClockSync = namedtuple('ClockSync', ['ply', 'game_ms', 'white_ms', 'black_ms'])
+
+
+def pack_move(move: chess.Move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def unpack_move(packed: int):
+    return chess.Move(packed & 0x3f, packed >> 6 & 0x3f, packed >> 12 or None)
+
+
+def is_binary(payload):
+    return len(payload) > 0 and payload[0] != PICKLE_PROTO
+
+
+# ply is the index of the move in the move stack, it lets a receiver skip moves it already has
+def encode_move(ply: int, move: chess.Move, elapsed_ms: int):
+    return HEADER.pack(PROTOCOL_VERSION, MOVE) + \
+        MOVE_BODY.pack(ply, move.from_square, move.to_square, move.promotion or 0, elapsed_ms)
+
+
+def encode_viewers(viewers: int):
+    return HEADER.pack(PROTOCOL_VERSION, VIEWERS) + VIEWERS_BODY.pack(viewers)
+
+
+# packed_moves is a run of PACKED_MOVE records, sent as stored without decoding them
+def encode_replay_chunk(start: int, packed_moves: bytes):
+    return HEADER.pack(PROTOCOL_VERSION, REPLAY_CHUNK) + \
+        REPLAY_CHUNK_BODY.pack(start, len(packed_moves) // PACKED_MOVE.size) + packed_moves
+
+
+# ply tells whose clock is running, a receiver ignores syncs for another ply than its board
+def encode_clock_sync(ply: int, game_ms: int, white_ms: int, black_ms: int):
+    return HEADER.pack(PROTOCOL_VERSION, CLOCK_SYNC) + CLOCK_SYNC_BODY.pack(ply, game_ms, white_ms, black_ms)
+
+
+def decode(payload):
+    version, message_type = HEADER.unpack_from(payload)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f'Unsupported protocol version {version}')
+
+    if message_type == MOVE:
+        ply, from_square, to_square, promotion, elapsed_ms = MOVE_BODY.unpack_from(payload, HEADER.size)
+        return MoveMessage(ply, chess.Move(from_square, to_square, promotion or None), elapsed_ms)
+    if message_type == VIEWERS:
+        return ViewersMessage(*VIEWERS_BODY.unpack_from(payload, HEADER.size))
+    if message_type == REPLAY_CHUNK:
+        start, count = REPLAY_CHUNK_BODY.unpack_from(payload, HEADER.size)
+        offset = HEADER.size + REPLAY_CHUNK_BODY.size
+        packed_moves = payload[offset:offset + count * PACKED_MOVE.size]
+        return ReplayChunk(start, [(unpack_move(packed), elapsed_ms)
+                                   for packed, elapsed_ms in PACKED_MOVE.iter_unpack(packed_moves)])
+    if message_type == CLOCK_SYNC:
+        return ClockSync(*CLOCK_SYNC_BODY.unpack_from(payload, HEADER.size))
+    raise ValueError(f'Unknown message type {message_type}')
+
+
+# decode any frame payload, binary message or pickled object
+def loads(payload):
+    if is_binary(payload):
+        return decode(payload)
+    return pickle.loads(payload)
@@ -0,0 +1,195 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# games are spread over the shards by id
+NUM_SHARDS = 16
+# finished games kept for spectators who pick a game just after it ended
+RECENT_GAMES = 256
+# removed rooms remembered for room list updates, a client that missed older removals gets the whole list
+MAX_REMOVED_ROOMS = 4096
+
+
+class Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.games = {}
+        self.locks = {}
+
+
+# every game of the server, split into shards so adding, removing and listing games only locks one shard at a time
+# each game also has its own lock, everything that changes a game or sends an update of it holds that lock,
+# so updates of one game go out in the order they happened and a slow client only holds up its own game
+class GameRegistry:
+    def __init__(self, num_shards=NUM_SHARDS):
+        self.shards = [Shard() for _ in range(num_shards)]
+
+    def shard(self, game_id: int):
+        return self.shards[game_id % len(self.shards)]
+
+    def add(self, game_id: int, game: dict):
+        shard = self.shard(game_id)
+        with shard.lock:
+            shard.games[game_id] = game
+            # re-entrant, a move holds it while the clock sync of the same game is sent
+            shard.locks[game_id] = threading.RLock()
+
+    def remove(self, game_id: int):
+        shard = self.shard(game_id)
+        with shard.lock:
+            shard.locks.pop(game_id, None)
+            return shard.games.pop(game_id, None)
+
+    # holds the lock of the game while the block runs and gives the game,
+    # None if there is no such game or it was removed while waiting for the lock
+    @contextmanager
+    def locked(self, game_id: int):
+        shard = self.shard(game_id)
+        lock = shard.locks.get(game_id)
+        if lock is None:
+            yield None
+            return
+        with lock:
+            yield shard.games.get(game_id)
+
+    def get(self, game_id: int):
+        return self.shard(game_id).games.get(game_id)
+
+    def __getitem__(self, game_id: int):
+        return self.shard(game_id).games[game_id]
+
+    def __contains__(self, game_id: int):
+        return game_id in self.shard(game_id).games
+
+    def __len__(self):
+        return sum(len(shard.games) for shard in self.shards)
+
+    # (game id, game) pairs copied shard by shard, safe while games are added and removed
+    def items(self):
+        items = []
+        for shard in self.shards:
+            with shard.lock:
+                items.extend(shard.games.items())
+        return items
+
+    def metrics(self):
+        sizes = [len(shard.games) for shard in self.shards]
+        return {
+            'games': sum(sizes),
+            'shards': len(sizes),
+            'largest_shard': max(sizes)
+        }
+
+
+# final game data of the most recently finished games, the least recently used one is dropped first
+class FinishedGames:
+    def __init__(self, capacity=RECENT_GAMES):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.payloads = OrderedDict()
+
+    def add(self, game_id: int, payload: bytes):
+        with self.lock:
+            self.payloads[game_id] = payload
+            self.payloads.move_to_end(game_id)
+            while len(self.payloads) > self.capacity:
+                self.payloads.popitem(last=False)
+
+    def get(self, game_id: int):
+        with self.lock:
+            payload = self.payloads.get(game_id)
+            if payload is not None:
+                self.payloads.move_to_end(game_id)
+            return payload
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'recent_games': len(self.payloads),
+                'recent_bytes': sum(len(payload) for payload in self.payloads.values())
+            }
+
+
+# the rooms of the room browser: running games and their viewer counts
+# every change gets the next version number, a client keeps the version of its last update as a cursor
+# and only gets the rooms added, removed or changed after it
+class RoomList:
+    def __init__(self, max_removed=MAX_REMOVED_ROOMS):
+        self.lock = threading.Lock()
+        self.version = 0
+        # game id -> viewers of every listed room
+        self.rooms = {}
+        # game id -> version of its last change, oldest first, removed rooms included
+        self.changes = OrderedDict()
+        self.num_removed = 0
+        self.max_removed = max_removed
+        # removals up to this version may be forgotten
+        self.horizon = 0
+
+    def update(self, game_id: int, viewers: int):
+        with self.lock:
+            if self.rooms.get(game_id, -1) == viewers:
+                return
+            self.rooms[game_id] = viewers
+            self.record(game_id)
+
+    def remove(self, game_id: int):
+        with self.lock:
+            if game_id not in self.rooms:
+                return
+            del self.rooms[game_id]
+            self.record(game_id)
+            self.num_removed += 1
+            if self.num_removed > self.max_removed:
+                self.forget_removed()
+
+    # must hold the lock
+    def record(self, game_id: int):
+        self.version += 1
+        self.changes[game_id] = self.version
+        self.changes.move_to_end(game_id)
+
+    # drop the older half of the removed rooms, a client that has not seen them yet gets the whole list
+    # must hold the lock
+    def forget_removed(self):
+        for game_id, version in list(self.changes.items()):
+            if self.num_removed <= self.max_removed // 2:
+                break
+            if game_id not in self.rooms:
+                del self.changes[game_id]
+                self.num_removed -= 1
+                self.horizon = version
+
+    # (game id, viewers) of every room
+    def listing(self):
+        with self.lock:
+            return sorted(self.rooms.items())
+
+    # version is the cursor for the next call, rooms holds (game id, viewers) of the rooms added or changed
+    # after since and removed the game ids of the rooms gone since then
+    # full is set when since is unknown or too old, rooms then holds every room and the old list must be dropped
+    def changes_since(self, since: int):
+        with self.lock:
+            if since <= 0 or since < self.horizon or since > self.version:
+                return {'version': self.version, 'full': True, 'rooms': sorted(self.rooms.items()), 'removed': []}
+            rooms = []
+            removed = []
+            for game_id, version in reversed(self.changes.items()):
+                if version <= since:
+                    break
+                if game_id in self.rooms:
+                    rooms.append((game_id, self.rooms[game_id]))
+                else:
+                    removed.append(game_id)
+            return {'version': self.version, 'full': False, 'rooms': rooms, 'removed': removed}
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'rooms': len(self.rooms),
+                'version': self.version,
+                'removed_remembered': self.num_removed
+            }
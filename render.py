@@ -0,0 +1,52 @@
+import pygame
+
+# posted by the network thread so a sleeping render loop wakes up
+NETWORK_EVENT = pygame.USEREVENT + 1
+
+
+# remembers what every region of the screen showed in the last frame
+# only regions whose state changed are redrawn and sent to the display
+class DirtyRegions:
+    def __init__(self):
+        self.states = {}
+        self.rects = []
+        self.full = True
+
+    # forget everything, the next frame redraws and flips the whole screen
+    def invalidate(self):
+        self.states.clear()
+        self.full = True
+
+    # store the new state of a region, True if the region has to be drawn again
+    def update(self, key, state, rect: pygame.Rect):
+        if not self.full and self.states.get(key) == state:
+            return False
+        self.states[key] = state
+        self.rects.append(rect)
+        return True
+
+    def flush(self):
+        if self.full:
+            pygame.display.flip()
+        elif self.rects:
+            pygame.display.update(self.rects)
+        self.rects.clear()
+        self.full = False
+
+
+def post_event(event_type: int):
+    try:
+        pygame.event.post(pygame.event.Event(event_type))
+    except pygame.error:
+        # the window is already closed
+        pass
+
+
+# block until an event arrives or timeout ms passed, None waits for the next event
+def wait_events(timeout=None):
+    if timeout is None:
+        event = pygame.event.wait()
+    else:
+        event = pygame.event.wait(max(1, int(timeout)))
+    events = [] if event.type == pygame.NOEVENT else [event]
+    return events + pygame.event.get()
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+
+from replay_store import ReplayStore
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# searchable list of saved replays, kept next to the replay store and updated on every save
+class ReplayCatalogue:
+    def __init__(self, path='replay/catalogue.db'):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS replays (
+                name TEXT PRIMARY KEY,
+                timestamp INTEGER NOT NULL,
+                game_id INTEGER NOT NULL,
+                white INTEGER,
+                black INTEGER,
+                winner TEXT NOT NULL,
+                plies INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS replays_timestamp ON replays (timestamp);
+            CREATE INDEX IF NOT EXISTS replays_white ON replays (white, timestamp);
+            CREATE INDEX IF NOT EXISTS replays_black ON replays (black, timestamp);
+        ''')
+        self.connection.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM replays').fetchone()[0]
+
+    def add(self, name: str, timestamp: int, game: dict):
+        with self.lock:
+            self.insert(name, timestamp, game)
+            self.connection.commit()
+
+    def insert(self, name: str, timestamp: int, game: dict):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO replays VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (name, timestamp, game['game_id'], game['white'], game['black'], game['winner'],
+             len(game['board'].move_stack))
+        )
+
+    # fill the catalogue from the store, needed once after migrating old replays or losing the database
+    def sync(self, store: ReplayStore):
+        if len(self) == len(store):
+            return 0
+        added = 0
+        with self.lock:
+            for name, game in store.scan():
+                self.insert(name, game['timestamp'], game)
+                added += 1
+            self.connection.commit()
+        return added
+
+    # newest first, optionally only games saved in [start, end] (epoch seconds) or played by one player
+    # before is the (timestamp, name) of a listed game, only it and the games listed after it are kept,
+    # so games saved later, even in the same second, do not shift the pages
+    def query(self, page=0, page_size=PAGE_SIZE, start=None, end=None, player=None, before=None):
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        conditions = []
+        parameters = []
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            parameters.append(start)
+        if end is not None:
+            conditions.append('timestamp <= ?')
+            parameters.append(end)
+        if player is not None:
+            conditions.append('(white = ? OR black = ?)')
+            parameters.extend([player, player])
+        if before is not None:
+            timestamp, name = before
+            conditions.append('(timestamp < ? OR (timestamp = ? AND name <= ?))')
+            parameters.extend([timestamp, timestamp, name])
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+        with self.lock:
+            total = self.connection.execute(f'SELECT COUNT(*) FROM replays {where}', parameters).fetchone()[0]
+            rows = self.connection.execute(
+                f'SELECT name, timestamp, game_id, white, black, winner, plies FROM replays {where} '
+                f'ORDER BY timestamp DESC, name DESC LIMIT ? OFFSET ?',
+                parameters + [page_size, page * page_size]
+            ).fetchall()
+
+        columns = ['name', 'timestamp', 'game_id', 'white', 'black', 'winner', 'plies']
+        return {
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'games': [dict(zip(columns, row)) for row in rows]
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
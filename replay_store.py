@@ -0,0 +1,254 @@
+import argparse
+import os
+import pickle
+import struct
+import threading
+import time
+from datetime import datetime
+
+import chess
+
+from protocol import PACKED_MOVE, pack_move, unpack_move
+from scheduler import DEFAULT_TIME_CONTROL, TimeControl
+from utility import get_all_file_names, push_move, Message
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+INDEX_FILE = 'index.log'
+MAX_SEGMENT_SIZE = 16 * 1024 * 1024
+NAME_FORMAT = '%d-%m-%Y_%H-%M-%S'
+
+RECORD_MAGIC = 0x52
+# magic, save time (epoch seconds), game id, white id, black id, winner, number of plies,
+# game time, player time, increment and delay of the time control in ms
+RECORD_HEADER = struct.Struct('>BIIiiBHIIII')
+# one protocol.PACKED_MOVE per ply, so a range of plies can be sent to a client as stored
+RECORD_MOVE = PACKED_MOVE
+# save time, game id, segment number, offset of the record, length of the record
+INDEX_ENTRY = struct.Struct('>IIIQI')
+
+WINNERS = ['', 'WHITE', 'BLACK', 'DRAW']
+
+
+def replay_name(timestamp: int, game_id: int):
+    return f'{datetime.fromtimestamp(timestamp).strftime(NAME_FORMAT)}_{game_id}'
+
+
+def encode_record(timestamp: int, game: dict):
+    moves = game['board'].move_stack
+    white = -1 if game['white'] is None else game['white']
+    black = -1 if game['black'] is None else game['black']
+    control = game.get('time_control', DEFAULT_TIME_CONTROL)
+    record = bytearray(RECORD_HEADER.pack(RECORD_MAGIC, timestamp, game['game_id'], white, black,
+                                          WINNERS.index(game['winner']), len(moves),
+                                          *(round(seconds * 1000) for seconds in control)))
+    for move, (time_to_move, _) in zip(moves, game['moves_information']):
+        record += RECORD_MOVE.pack(pack_move(move), max(0, time_to_move))
+    return bytes(record)
+
+
+def decode_header(record: bytes):
+    magic, timestamp, game_id, white, black, winner, plies, *control = RECORD_HEADER.unpack_from(record)
+    if magic != RECORD_MAGIC:
+        raise ValueError('Corrupted replay record')
+    return {
+        'timestamp': timestamp,
+        'game_id': game_id,
+        'white': None if white == -1 else white,
+        'black': None if black == -1 else black,
+        'winner': WINNERS[winner],
+        'plies': plies,
+        'time_control': TimeControl(*(value / 1000 for value in control))
+    }
+
+
+# rebuild the game data the replay client expects from a stored record
+def decode_record(record: bytes):
+    header = decode_header(record)
+
+    board = chess.Board()
+    moves_information = []
+    for packed, elapsed_ms in RECORD_MOVE.iter_unpack(record[RECORD_HEADER.size:]):
+        push_move(board, moves_information, unpack_move(packed), elapsed_ms)
+    return {
+        'game_id': header['game_id'],
+        'board': board,
+        'state': Message.DISCONNECT,
+        'moves_information': moves_information,
+        'white': header['white'],
+        'black': header['black'],
+        'viewers': 0,
+        'winner': header['winner'],
+        'timestamp': header['timestamp'],
+        'time_control': header['time_control']
+    }
+
+
+# finished games as packed move sequences appended to segment files
+# the index maps every replay name to (segment, offset, length) and is loaded in memory on start
+class ReplayStore:
+    def __init__(self, folder='replay', max_segment_size=MAX_SEGMENT_SIZE):
+        self.folder = folder
+        self.max_segment_size = max_segment_size
+        self.lock = threading.Lock()
+        self.index = {}
+        self.segments = {}
+        os.makedirs(folder, exist_ok=True)
+
+        self.load_index()
+        segment_numbers = self.segment_numbers()
+        self.active_segment = segment_numbers[-1] if segment_numbers else 0
+        self.writer = open(self.segment_path(self.active_segment), 'ab')
+        self.index_writer = open(os.path.join(folder, INDEX_FILE), 'ab')
+
+    def segment_path(self, number: int):
+        return os.path.join(self.folder, f'{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}')
+
+    def segment_numbers(self):
+        numbers = []
+        for file_name in get_all_file_names(self.folder):
+            if file_name.startswith(SEGMENT_PREFIX) and file_name.endswith(SEGMENT_SUFFIX):
+                numbers.append(int(file_name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        return sorted(numbers)
+
+    def load_index(self):
+        index_path = os.path.join(self.folder, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'rb') as file:
+            data = file.read()
+        # a crash can leave a partial entry at the end, ignore it
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        for timestamp, game_id, segment, offset, length in INDEX_ENTRY.iter_unpack(data[:usable]):
+            self.index[replay_name(timestamp, game_id)] = (segment, offset, length)
+
+    # one read handle per segment, kept open for the lifetime of the store
+    def segment_reader(self, number: int):
+        reader = self.segments.get(number)
+        if reader is None:
+            reader = open(self.segment_path(number), 'rb')
+            self.segments[number] = reader
+        return reader
+
+    def append(self, game: dict, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+        return self.append_record(encode_record(timestamp, game))
+
+    # store an already encoded record, the worker processes of a cluster send them encoded
+    def append_record(self, record: bytes):
+        _, timestamp, game_id = RECORD_HEADER.unpack_from(record)[:3]
+        with self.lock:
+            if self.writer.tell() > 0 and self.writer.tell() + len(record) > self.max_segment_size:
+                self.writer.close()
+                self.active_segment += 1
+                self.writer = open(self.segment_path(self.active_segment), 'ab')
+
+            offset = self.writer.tell()
+            self.writer.write(record)
+            self.writer.flush()
+            self.index_writer.write(INDEX_ENTRY.pack(timestamp, game_id, self.active_segment,
+                                                     offset, len(record)))
+            self.index_writer.flush()
+
+            name = replay_name(timestamp, game_id)
+            self.index[name] = (self.active_segment, offset, len(record))
+        return name
+
+    def read_record(self, name: str):
+        with self.lock:
+            segment, offset, length = self.index[name]
+            reader = self.segment_reader(segment)
+            reader.seek(offset)
+            return reader.read(length)
+
+    def load(self, name: str):
+        return decode_record(self.read_record(name))
+
+    # header of a record without its moves, see decode_header
+    def read_header(self, name: str):
+        with self.lock:
+            segment, offset, length = self.index[name]
+            reader = self.segment_reader(segment)
+            reader.seek(offset)
+            return decode_header(reader.read(min(length, RECORD_HEADER.size)))
+
+    # packed moves of plies [start, end) as stored
+    def read_moves(self, name: str, start: int, end: int):
+        with self.lock:
+            segment, offset, length = self.index[name]
+            reader = self.segment_reader(segment)
+            start_offset = RECORD_HEADER.size + start * RECORD_MOVE.size
+            end_offset = min(length, RECORD_HEADER.size + end * RECORD_MOVE.size)
+            if end_offset <= start_offset:
+                return b''
+            reader.seek(offset + start_offset)
+            return reader.read(end_offset - start_offset)
+
+    def __contains__(self, name: str):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    # replay names in the order they were saved
+    def names(self):
+        with self.lock:
+            return list(self.index)
+
+    # read every segment front to back, yield (name, game data)
+    def scan(self):
+        for number in self.segment_numbers():
+            with open(self.segment_path(number), 'rb') as file:
+                data = file.read()
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(data):
+                header = RECORD_HEADER.unpack_from(data, offset)
+                length = RECORD_HEADER.size + header[6] * RECORD_MOVE.size
+                record = data[offset:offset + length]
+                yield replay_name(header[1], header[2]), decode_record(record)
+                offset += length
+
+    def close(self):
+        with self.lock:
+            self.writer.close()
+            self.index_writer.close()
+            for reader in self.segments.values():
+                reader.close()
+            self.segments.clear()
+
+
+# move the old one pickle per game replays into the store, return the number of migrated games
+def migrate_pickle_replays(store: ReplayStore, folder: str, remove=False):
+    migrated = 0
+    for file_name in sorted(get_all_file_names(folder)):
+        if not file_name.endswith('.pkl'):
+            continue
+        day, hour, game_id = file_name[:-4].split('_')
+        timestamp = int(datetime.strptime(f'{day}_{hour}', NAME_FORMAT).timestamp())
+        if replay_name(timestamp, int(game_id)) in store:
+            continue
+
+        file_path = os.path.join(folder, file_name)
+        with open(file_path, 'rb') as file:
+            game = pickle.load(file)
+        # the pickled games kept the time to move in seconds
+        game['moves_information'] = [(time_to_move * 1000, captured_piece)
+                                     for time_to_move, captured_piece in game['moves_information']]
+        store.append(game, timestamp)
+        migrated += 1
+        if remove:
+            os.remove(file_path)
+    return migrated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate pickled replays into the replay store')
+    parser.add_argument('--folder', default='replay', help='folder of the .pkl replays and of the store')
+    parser.add_argument('--remove', action='store_true', help='delete every .pkl file once it is migrated')
+    args = parser.parse_args()
+
+    replay_store = ReplayStore(args.folder)
+    count = migrate_pickle_replays(replay_store, args.folder, args.remove)
+    replay_store.close()
+    print(f'Migrated {count} replays, {len(replay_store)} replays in the store')
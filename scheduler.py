@@ -0,0 +1,171 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+
+GAME = 'game'
+WHITE = 'white'
+BLACK = 'black'
+SYNC = 'sync'
+
+# seconds between two clock syncs of a running game
+SYNC_INTERVAL = 5.0
+# the heap is cleaned once it holds this many entries per tracked game (plus a few)
+HEAP_ENTRIES_PER_GAME = 6
+
+# game and player time in seconds, increment (Fischer) and delay (Bronstein) are given back to a player
+# after each of their moves
+TimeControl = namedtuple('TimeControl', ['game', 'player', 'increment', 'delay'])
+DEFAULT_TIME_CONTROL = TimeControl(60*20, 60*15, 0, 0)
+
+
+# seconds added to the clock of a player who spent spent seconds on a move
+# the delay only gives back time that was actually used
+def time_bonus(control: TimeControl, spent: float):
+    return control.increment + min(max(0.0, spent), control.delay)
+
+
+# game and player clocks of one game, stored as monotonic deadlines instead of counters
+class GameClock:
+    def __init__(self, control: TimeControl, now: float):
+        self.control = control
+        self.game_deadline = now + control.game
+        self.remaining = {WHITE: float(control.player), BLACK: float(control.player)}
+        self.turn = WHITE
+        self.turn_start = now
+        # number of turn switches, the same as the number of moves played
+        self.generation = 0
+
+    def player_deadline(self):
+        return self.turn_start + self.remaining[self.turn]
+
+    # seconds the player to move spent on the move
+    def switch_turn(self, turn: str, now: float):
+        spent = now - self.turn_start
+        remaining = self.remaining[self.turn] - spent
+        # a flag that already fell is not raised again by the bonus
+        self.remaining[self.turn] = remaining + time_bonus(self.control, spent) if remaining > 0 else 0.0
+        self.turn = turn
+        self.turn_start = now
+        self.generation += 1
+        return spent
+
+    def time_left(self, now: float):
+        result = {
+            GAME: max(0.0, self.game_deadline - now),
+            WHITE: self.remaining[WHITE],
+            BLACK: self.remaining[BLACK]
+        }
+        result[self.turn] = max(0.0, self.player_deadline() - now)
+        return result
+
+
+# one thread and one heap of deadlines for the clocks of every game
+# each push/pop is O(log n), entries made stale by a turn switch are skipped when they surface
+# on_sync is called every sync_interval seconds for every running game
+class ClockScheduler:
+    def __init__(self, on_time_out, on_sync=None, sync_interval=SYNC_INTERVAL):
+        self.on_time_out = on_time_out
+        self.on_sync = on_sync
+        self.sync_interval = sync_interval
+        self.clocks = {}
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def push(self, deadline: float, game_id: int, kind: str, generation: int):
+        heapq.heappush(self.heap, (deadline, next(self.counter), game_id, kind, generation))
+        # wake the scheduler only if this deadline is the new earliest one
+        if self.heap[0][0] == deadline:
+            self.condition.notify()
+
+    def add_game(self, game_id: int, control=DEFAULT_TIME_CONTROL):
+        with self.condition:
+            now = time.monotonic()
+            clock = GameClock(control, now)
+            self.clocks[game_id] = clock
+            self.push(clock.game_deadline, game_id, GAME, -1)
+            self.push(clock.player_deadline(), game_id, clock.turn, clock.generation)
+            if self.on_sync is not None:
+                self.push(now + self.sync_interval, game_id, SYNC, -1)
+
+    # seconds spent on the move by the player whose turn ends, None if the game is not tracked
+    def switch_turn(self, game_id: int, turn: str):
+        with self.condition:
+            clock = self.clocks.get(game_id)
+            if clock is None:
+                return None
+            spent = clock.switch_turn(turn, time.monotonic())
+            self.push(clock.player_deadline(), game_id, clock.turn, clock.generation)
+            self.compact()
+            return spent
+
+    # stop tracking the game, pending deadlines of it are dropped lazily
+    def remove_game(self, game_id: int):
+        with self.condition:
+            self.clocks.pop(game_id, None)
+            self.compact()
+
+    # every move and every finished game leaves a deadline behind that is only dropped once it is due,
+    # minutes later, drop them all at once when they start to outnumber the live ones
+    # must hold the condition
+    def compact(self):
+        if len(self.heap) > HEAP_ENTRIES_PER_GAME * len(self.clocks) + 64:
+            self.heap = [entry for entry in self.heap if self.is_valid(entry[2], entry[3], entry[4])]
+            heapq.heapify(self.heap)
+
+    # remaining seconds with ms precision for the game and both players, None if the game is not tracked
+    def time_left(self, game_id: int):
+        with self.condition:
+            clock = self.clocks.get(game_id)
+            if clock is None:
+                return None
+            return {kind: round(value, 3) for kind, value in clock.time_left(time.monotonic()).items()}
+
+    # (moves played, remaining ms per clock) read together, None if the game is not tracked
+    def clock_state(self, game_id: int):
+        with self.condition:
+            clock = self.clocks.get(game_id)
+            if clock is None:
+                return None
+            time_left = clock.time_left(time.monotonic())
+            return clock.generation, {kind: int(value * 1000) for kind, value in time_left.items()}
+
+    def is_valid(self, game_id: int, kind: str, generation: int):
+        clock = self.clocks.get(game_id)
+        if clock is None:
+            return False
+        if kind == GAME or kind == SYNC:
+            return True
+        return clock.generation == generation and clock.turn == kind
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    timeout = self.heap[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+
+                deadline, _, game_id, kind, generation = heapq.heappop(self.heap)
+                if not self.is_valid(game_id, kind, generation):
+                    continue
+                if kind == SYNC:
+                    self.push(deadline + self.sync_interval, game_id, SYNC, -1)
+
+            # run the callback outside the lock so it can query or update the clocks
+            if kind == SYNC:
+                self.on_sync(game_id)
+            else:
+                self.on_time_out(game_id, kind)
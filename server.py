@@ -1,34 +1,66 @@
+import argparse
 import socket
 import pickle
 import threading
 import time
-from datetime import datetime
 
 import chess
 
+import movecache
+import protocol
+import replay_catalogue
+import scheduler
 import utility
 from utility import get_logger, Message
-from collections import deque
+from framing import Connection, QueuedConnection
+from matchmaking import MatchmakingQueue
+from registry import FinishedGames, GameRegistry, RoomList
+from replay_store import ReplayStore, decode_record
+from snapshot import SnapshotCache
+
+# plies per message when a replay is streamed
+REPLAY_CHUNK_PLIES = 64
 
 
 class Server:
-    def __init__(self, ip='127.0.0.1', port=5555):
+    def __init__(self, ip='127.0.0.1', port=5555, time_control=scheduler.DEFAULT_TIME_CONTROL):
         self.logger = get_logger()
         self.ip = ip
         self.port = port
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # ---------------------------------------
         self.num_games = 0
-        self.games = {}
-        self.player_queue = deque()
+        self.games = GameRegistry()
+        self.finished_games = FinishedGames()
+        self.rooms = RoomList()
+        self.num_retired = 0
+        self.positions = {}
+        self.move_cache = movecache.LegalMoveCache()
+        self.player_queue = MatchmakingQueue()
         self.num_players = 0
         self.connecting_players = {}
+        # a player is put into a game and taken out of the player table under this lock
+        self.players_lock = threading.Lock()
         self.num_viewers = 0
+        self.subscribers = {}
+        self.subscribers_lock = threading.Lock()
+        self.snapshots = SnapshotCache()
         self.num_replays = 0
+        self.replay_store, self.replay_catalogue = self.open_replays()
+        # ---------------------------------------
+        self.time_control = time_control
+        self.clock_scheduler = scheduler.ClockScheduler(self.on_time_out, self.on_clock_sync)
         # ---------------------------------------
         self.header_length = 4
         self.bind_socket()
 
+    # saved games and their searchable list
+    def open_replays(self):
+        store = ReplayStore('replay')
+        catalogue = replay_catalogue.ReplayCatalogue('replay/catalogue.db')
+        catalogue.sync(store)
+        return store, catalogue
+
     def bind_socket(self):
         try:
             self.server_socket.bind((self.ip, self.port))
@@ -37,29 +69,13 @@ class Server:
             self.logger.error(str(e))
             return False
 
-    def client_play(self, con: socket.socket, player_id: int):
+    def client_play(self, con: Connection, player_id: int):
         while True:
             try:
                 receive_data = self.receive(con)
                 if receive_data is None:
                     break
-
-                game_id = self.connecting_players[player_id]['game_id']
-                self.games[game_id]['board'] = receive_data['board']
-                self.games[game_id]['moves_information'] = receive_data['moves_information']
-                if self.games[game_id]['board'].is_checkmate():
-                    if self.games[game_id]['board'].turn:
-                        self.games[game_id]['winner'] = 'BLACK'
-                    else:
-                        self.games[game_id]['winner'] = 'WHITE'
-
-                if player_id == self.games[game_id]['white']:
-                    opponent_id = self.games[game_id]['black']
-                else:
-                    opponent_id = self.games[game_id]['white']
-
-                send_data = self.games[game_id]
-                self.send(self.connecting_players[opponent_id]['connection'], send_data)
+                self.handle_player_data(player_id, receive_data)
             except Exception as er:
                 self.logger.error(str(er))
                 break
@@ -67,150 +83,309 @@ class Server:
         self.disconnect_player(player_id)
         con.close()
 
-    def countdown_game(self, game_id: int):
-        while self.games[game_id]['state'] == Message.READY:
-            try:
-                self.games[game_id]['time']['game'] -= 1
-                time.sleep(1)
-            except Exception as er:
-                self.logger.error(str(er))
+    # update the game with the player's move and relay it to the opponent
+    def handle_player_data(self, player_id: int, receive_data: protocol.MoveMessage):
+        game_id = self.connecting_players[player_id]['game_id']
+        with self.games.locked(game_id) as game:
+            if game is None:
+                return
+            if not self.is_valid_move(game_id, player_id, receive_data):
+                self.logger.warning(f'Player {player_id} sent an invalid move {receive_data.move}')
+                # resynchronise the player with the server's board
+                self.send_game(self.connecting_players[player_id]['connection'], game_id)
+                return
+
+            ply = len(game['board'].move_stack)
+            # the time of the move comes from the server clock, what the client says it spent is ignored
+            turn = scheduler.BLACK if game['board'].turn else scheduler.WHITE
+            spent = self.clock_scheduler.switch_turn(game_id, turn)
+            elapsed_ms = 0 if spent is None else int(spent * 1000)
+            utility.push_move(game['board'], game['moves_information'], receive_data.move, elapsed_ms)
+            self.positions[game_id] = self.move_cache.get(game['board'])
+            self.snapshots.invalidate(game_id)
+
+            winner = movecache.game_result(game['board'], self.positions[game_id])
+            if winner:
+                game['winner'] = winner
+                self.stop_clock(game_id)
+                self.update_room(game_id, game)
+            else:
+                self.update_game_time(game_id)
 
-    def countdown_white(self, game_id: int):
-        while self.games[game_id]['state'] == Message.READY:
-            try:
-                if self.games[game_id]['board'].turn:
-                    self.games[game_id]['time']['white'] -= 1
-                    time.sleep(1)
-            except Exception as er:
-                self.logger.error(str(er))
+            if player_id == game['white']:
+                opponent_id = game['black']
+            else:
+                opponent_id = game['white']
+
+            # relay only the move, the opponent and the viewers apply it to their own board
+            send_data = protocol.encode_move(ply, receive_data.move, elapsed_ms)
+            self.send_to_player(opponent_id, send_data)
+            self.broadcast(game_id, send_data)
+            if winner:
+                # the clocks are stopped, the final game data tells everyone how the game ended
+                self.send_game_over(game_id)
+            else:
+                # the clocks after the move, with the increment or delay of the mover
+                self.send_clock_sync(game_id)
 
-    def countdown_black(self, game_id: int):
-        while self.games[game_id]['state'] == Message.READY:
-            try:
-                if not self.games[game_id]['board'].turn:
-                    self.games[game_id]['time']['black'] -= 1
-                    time.sleep(1)
-            except Exception as er:
-                self.logger.error(str(er))
+    # the move must come from the side to move, follow the last known ply and be legal in the position
+    def is_valid_move(self, game_id: int, player_id: int, receive_data: protocol.MoveMessage):
+        game = self.games[game_id]
+        if game['state'] != Message.READY or game['winner'] != '':
+            return False
+        if (game['white'] == player_id) != game['board'].turn:
+            return False
+        if receive_data.ply != len(game['board'].move_stack):
+            return False
+        return receive_data.move in self.positions[game_id].legal_moves
+
+    # copy the scheduler clocks into the game data before it is sent
+    def update_game_time(self, game_id: int):
+        time_left = self.clock_scheduler.time_left(game_id)
+        if time_left is not None and time_left != self.games[game_id]['time']:
+            self.games[game_id]['time'] = time_left
+            self.snapshots.invalidate(game_id)
+
+    def stop_clock(self, game_id: int):
+        self.update_game_time(game_id)
+        self.clock_scheduler.remove_game(game_id)
+
+    # called from the scheduler thread
+    def on_time_out(self, game_id: int, kind: str):
+        self.handle_time_out(game_id, kind)
+
+    # called from the scheduler thread every scheduler.SYNC_INTERVAL seconds for every running game
+    def on_clock_sync(self, game_id: int):
+        self.send_clock_sync(game_id)
+
+    # the server clocks are the only real ones, players and viewers interpolate between two syncs
+    def send_clock_sync(self, game_id: int):
+        with self.games.locked(game_id) as game:
+            clock_state = self.clock_scheduler.clock_state(game_id)
+            if game is None or clock_state is None or game['state'] != Message.READY:
+                return
+            ply, clocks = clock_state
+            send_data = protocol.encode_clock_sync(ply, clocks[scheduler.GAME], clocks[scheduler.WHITE],
+                                                   clocks[scheduler.BLACK])
+            for player_id in (game['white'], game['black']):
+                self.send_to_player(player_id, send_data)
+            self.broadcast(game_id, send_data)
+
+    def handle_time_out(self, game_id: int, kind: str):
+        with self.games.locked(game_id) as game:
+            if game is None or game['state'] != Message.READY:
+                return
+
+            self.stop_clock(game_id)
+            game['time'][kind] = 0
+            if kind == scheduler.WHITE and game['winner'] == '':
+                game['winner'] = 'BLACK'
+            elif kind == scheduler.BLACK and game['winner'] == '':
+                game['winner'] = 'WHITE'
+            elif kind == scheduler.GAME and game['winner'] == '':
+                # the game time is up before either flag fell, no more moves are accepted
+                game['winner'] = 'DRAW'
+            self.update_room(game_id, game)
+            self.logger.info(f'Game {game_id}: {kind} time is over')
+            self.send_game_over(game_id)
+
+    # the final game data with the winner to both players and every viewer, call with the game lock held
+    def send_game_over(self, game_id: int):
+        game = self.games[game_id]
+        self.snapshots.invalidate(game_id)
+        send_data = self.get_game_payload(game_id)
+        for player_id in (game['white'], game['black']):
+            self.send_to_player(player_id, send_data)
+        self.broadcast(game_id, send_data)
 
     def disconnect_player(self, player_id):
-        game_id = self.connecting_players[player_id]['game_id']
+        with self.players_lock:
+            game_id = self.connecting_players.pop(player_id)['game_id']
         # check if client already in a game
         if game_id is None:
             self.player_queue.remove(player_id)
+            self.logger.debug(f'Queue metrics: {self.player_queue.metrics()}')
         else:
-            self.games[game_id]['state'] = Message.DISCONNECT
-            white_id = self.games[game_id]['white']
-            black_id = self.games[game_id]['black']
-            if self.games[game_id]['winner'] == '':
-                if self.games[game_id]['white'] == player_id:
-                    self.games[game_id]['winner'] = 'BLACK'
+            with self.games.locked(game_id) as game:
+                self.stop_clock(game_id)
+                game['state'] = Message.DISCONNECT
+                self.update_room(game_id, game)
+                white_id = game['white']
+                black_id = game['black']
+                if game['winner'] == '':
+                    if white_id == player_id:
+                        game['winner'] = 'BLACK'
+                    else:
+                        game['winner'] = 'WHITE'
+
+                # the first of the two players to leave saves the game
+                if white_id is not None and black_id is not None:
+                    self.save_game_replay(game_id)
+
+                if white_id == player_id:
+                    game['white'] = None
+                    opponent_id = black_id
                 else:
-                    self.games[game_id]['winner'] = 'WHITE'
+                    game['black'] = None
+                    opponent_id = white_id
 
-            if white_id is not None and black_id is not None:
-                self.save_game_replay(game_id)
+                self.snapshots.invalidate(game_id)
+                send_data = self.get_game_payload(game_id)
+                self.send_to_player(opponent_id, send_data)
+                self.broadcast(game_id, send_data)
 
-            if white_id == player_id:
-                self.games[game_id]['white'] = None
-                try:
-                    self.send(self.connecting_players[black_id]['connection'], self.games[game_id])
-                except Exception as er:
-                    self.logger.error(er)
-            else:
-                self.games[game_id]['black'] = None
-                try:
-                    self.send(self.connecting_players[white_id]['connection'], self.games[game_id])
-                except Exception as er:
-                    self.logger.error(er)
+                if game['white'] is None and game['black'] is None:
+                    self.retire_game(game_id)
 
-        self.connecting_players.pop(player_id)
         self.logger.info(f'Player {player_id} disconnected')
 
+    # both players left and the replay is saved, only the final game data stays for late spectators,
+    # everything else the server keeps per game is dropped
+    def retire_game(self, game_id: int):
+        self.finished_games.add(game_id, self.get_game_payload(game_id))
+        self.games.remove(game_id)
+        self.positions.pop(game_id, None)
+        self.snapshots.remove(game_id)
+        with self.subscribers_lock:
+            self.subscribers.pop(game_id, None)
+        self.num_retired += 1
+        self.logger.debug(f'Game {game_id} retired, {len(self.games)} games running')
+
     def save_game_replay(self, game_id: int):
-        current_time = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
-        file_path = f'replay/{current_time}_{game_id}.pkl'
-        with open(file_path, 'wb') as file:
-            pickle.dump(self.games[game_id], file)
+        timestamp = int(time.time())
+        name = self.replay_store.append(self.games[game_id], timestamp)
+        self.replay_catalogue.add(name, timestamp, self.games[game_id])
+
+    # store a game that was encoded elsewhere, the catalogue row comes from the record itself
+    def save_record(self, record: bytes):
+        name = self.replay_store.append_record(record)
+        game = decode_record(record)
+        self.replay_catalogue.add(name, game['timestamp'], game)
+
+    # the player may have left in the meantime
+    def send_to_player(self, player_id: int, payload: bytes):
+        player = self.connecting_players.get(player_id)
+        if player is not None:
+            self.send_payload(player['connection'], payload)
 
     # send data length first, data second
-    def send(self, con: socket.socket, data):
+    def send(self, con: Connection, data):
+        try:
+            return self.send_payload(con, pickle.dumps(data))
+        except Exception as er:
+            self.logger.error(str(er))
+            return False
+
+    # game data is pickled once per change and shared by every recipient
+    # a finished game that was already retired comes from the recent games, None if it is gone from there too
+    def get_game_payload(self, game_id: int):
+        with self.games.locked(game_id) as game:
+            if game is None:
+                return self.finished_games.get(game_id)
+            return self.snapshots.get(game_id, game)
+
+    def send_game(self, con: Connection, game_id: int):
         try:
-            send_data = pickle.dumps(data)
-            send_length = len(send_data)
-            con.sendall(send_length.to_bytes(self.header_length, byteorder='big'))
-            con.sendall(send_data)
+            return self.send_payload(con, self.get_game_payload(game_id))
+        except Exception as er:
+            self.logger.error(str(er))
+            return False
+
+    # send an already encoded payload
+    def send_payload(self, con: Connection, payload: bytes):
+        try:
+            con.send_frame(payload)
             return True
         except Exception as er:
             self.logger.error(str(er))
             return False
 
     # receive data length first, data second
-    def receive(self, con: socket.socket):
+    def receive(self, con: Connection):
         try:
-            receive_length = int.from_bytes(con.recv(self.header_length), byteorder='big')
-            receive_data = pickle.loads(con.recv(receive_length))
-            return receive_data
+            receive_data = con.receive_frame()
+            if receive_data is None:
+                return None
+            return protocol.loads(receive_data)
         except Exception as er:
             self.logger.error(er)
 
-    # matchmaking 2 player
+    # matchmaking 2 player, sleep until the queue has a pair to offer
     def player_queue_handle(self):
         while True:
-            # match 2 player that are in queue
-            if len(self.player_queue) >= 2:
-                white = self.player_queue.popleft()
-                black = self.player_queue.popleft()
+            self.match_players(self.player_queue.pop_pairs())
+
+    def match_players(self, pairs: list[tuple]):
+        for white, black in pairs:
+            self.create_game(white, black)
+        if pairs:
+            self.logger.debug(f'Queue metrics: {self.player_queue.metrics()}')
+
+    # game_id is given when the id was already picked by a cluster supervisor
+    def create_game(self, white: int, black: int, game_id=None):
+        with self.players_lock:
+            # a player can leave between being matched and getting here, the other one is queued again
+            gone = [player_id for player_id in (white, black) if player_id not in self.connecting_players]
+            if gone:
+                for player_id in (white, black):
+                    if player_id not in gone:
+                        self.player_queue.append(player_id)
+                self.logger.info(f'Player {gone[0]} left before the game started')
+                return
+
+            if game_id is None:
                 game_id = self.num_games
                 self.num_games += 1
-                self.games[game_id] = {
-                    'game_id': game_id,
-                    'board': chess.Board(),
-                    'state': Message.READY,
-                    'moves_information': [],
-                    'white': white,
-                    'black': black,
-                    'viewers': 0,
-                    'winner': '',
-                    'time': {
-                        'game': 60*20,
-                        'white': 60*15,
-                        'black': 60*15
-                    }
-                }
-                self.connecting_players[white]['game_id'] = game_id
-                self.connecting_players[black]['game_id'] = game_id
-
-                # inform both player that game is ready
-                self.send(self.connecting_players[white]['connection'], self.games[game_id])
-                self.send(self.connecting_players[black]['connection'], self.games[game_id])
-
-                # start the timer
-                game_timer_thread = threading.Thread(target=self.countdown_game, args=(game_id,), daemon=True)
-                game_timer_thread.start()
-                white_timer_thread = threading.Thread(target=self.countdown_white, args=(game_id,), daemon=True)
-                white_timer_thread.start()
-                black_timer_thread = threading.Thread(target=self.countdown_black, args=(game_id,), daemon=True)
-                black_timer_thread.start()
-
-    def client_view(self, con: socket.socket, viewer_id: int):
+            game = {
+                'game_id': game_id,
+                'board': chess.Board(),
+                'state': Message.READY,
+                'moves_information': [],
+                'white': white,
+                'black': black,
+                'viewers': 0,
+                'winner': '',
+                'time': {
+                    'game': self.time_control.game,
+                    'white': self.time_control.player,
+                    'black': self.time_control.player
+                },
+                'time_control': self.time_control
+            }
+            self.positions[game_id] = self.move_cache.get(game['board'])
+            self.games.add(game_id, game)
+            self.connecting_players[white]['game_id'] = game_id
+            self.connecting_players[black]['game_id'] = game_id
+
+        with self.games.locked(game_id):
+            # inform both player that game is ready
+            send_data = self.get_game_payload(game_id)
+            self.send_to_player(white, send_data)
+            self.send_to_player(black, send_data)
+
+            # start the clocks and list the room, unless a player already left
+            if game['state'] == Message.READY:
+                self.clock_scheduler.add_game(game_id, self.time_control)
+                self.update_room(game_id, game)
+
+    def client_view(self, con: Connection, viewer_id: int):
         selection = Message.NO_SELECTION
         while True:
             try:
                 if selection == Message.NO_SELECTION:
                     message = self.receive(con)
+                    if message is None:
+                        break
                     if message == Message.ALL_DATA:
                         self.send(con, self.get_active_games())
+                    elif message == Message.METRICS:
+                        self.send(con, self.get_metrics())
+                    elif isinstance(message, dict):
+                        self.send(con, self.get_room_changes(message))
                     else:
                         selection = message
                 else:
-                    self.games[selection]['viewers'] += 1
-                    while True:
-                        if self.receive(con) == Message.VIEWING:
-                            self.send(con, self.games[selection])
-                        else:
-                            self.games[selection]['viewers'] -= 1
-                            break
+                    self.view_game(con, selection)
                     selection = Message.NO_SELECTION
                     break
             except Exception as er:
@@ -220,28 +395,113 @@ class Server:
         self.logger.info(f'Viewer {viewer_id} disconnected')
         con.close()
 
+    # updates are pushed until the viewer stops viewing or leaves
+    def view_game(self, con: Connection, game_id: int):
+        self.add_subscriber(game_id, con)
+        self.receive(con)
+        self.remove_subscriber(game_id, con)
+
+    # send the current game once, then every move and clock event of it
+    # the snapshot goes out under the game lock so no broadcast can overtake it, moves already in it are
+    # recognised by their ply on the viewer side
+    def add_subscriber(self, game_id: int, con):
+        with self.games.locked(game_id) as game:
+            if game is None:
+                # a game that ended a moment ago is shown as it finished, no update will follow
+                send_data = self.finished_games.get(game_id)
+                if send_data is None:
+                    raise KeyError(f'Game {game_id} does not exist')
+                self.send_payload(con, send_data)
+                return
+            game['viewers'] += 1
+            self.update_room(game_id, game)
+            self.snapshots.invalidate(game_id)
+            self.update_game_time(game_id)
+            self.send_game(con, game_id)
+            with self.subscribers_lock:
+                self.subscribers.setdefault(game_id, set()).add(con)
+            self.broadcast(game_id, protocol.encode_viewers(game['viewers']))
+
+    def remove_subscriber(self, game_id: int, con):
+        with self.games.locked(game_id) as game:
+            # retired meanwhile, its subscribers are already gone
+            if game is None:
+                return
+            with self.subscribers_lock:
+                self.subscribers[game_id].discard(con)
+            game['viewers'] -= 1
+            self.update_room(game_id, game)
+            self.snapshots.invalidate(game_id)
+            self.broadcast(game_id, protocol.encode_viewers(game['viewers']))
+
+    # write the same encoded update to every viewer of the game
+    def broadcast(self, game_id: int, payload: bytes):
+        with self.subscribers_lock:
+            subscribers = tuple(self.subscribers.get(game_id, ()))
+        for con in subscribers:
+            self.send_payload(con, payload)
+
+    def get_metrics(self):
+        return {
+            'queue': self.player_queue.metrics(),
+            'games': self.games.metrics(),
+            'finished_games': self.finished_games.metrics(),
+            'rooms': self.rooms.metrics(),
+            'memory': self.get_memory_metrics(),
+            'snapshots': self.snapshots.metrics(),
+            'positions': self.move_cache.metrics()
+        }
+
+    # memory of the server next to the number of games it holds, finished games must not make it grow
+    def get_memory_metrics(self):
+        rss_kb, peak_rss_kb = utility.memory_usage()
+        return {
+            'rss_kb': rss_kb,
+            'peak_rss_kb': peak_rss_kb,
+            'running_games': len(self.games),
+            'recent_games': len(self.finished_games),
+            'retired_games': self.num_retired,
+            'games_played': self.num_games
+        }
+
+    # a room is listed while its game is running and undecided
+    @staticmethod
+    def is_listed(game: dict):
+        return game['state'] == Message.READY and game['winner'] == ''
+
+    # call with the game lock held after the state, winner or viewers change
+    def update_room(self, game_id: int, game: dict):
+        if self.is_listed(game):
+            self.rooms.update(game_id, game['viewers'])
+        else:
+            self.rooms.remove(game_id)
+
     # return active game id and current viewer number
     def get_active_games(self):
-        active_games = []
-        for game_id in self.games:
-            if self.games[game_id]['state'] == Message.READY:
-                active_games.append((game_id, self.games[game_id]['viewers']))
-        return active_games
+        return self.rooms.listing()
 
-    def client_replay(self, con: socket.socket, replay_id: int):
+    # request keys: rooms (version of the last room list the client has, 0 for none), see RoomList.changes_since
+    def get_room_changes(self, request: dict):
+        return self.rooms.changes_since(int(request.get('rooms', 0)))
+
+    def client_replay(self, con: Connection, replay_id: int):
         selection = Message.NO_SELECTION
         while True:
             try:
                 if selection == Message.NO_SELECTION:
                     message = self.receive(con)
+                    if message is None:
+                        break
                     if message == Message.ALL_DATA:
                         self.send(con, self.get_all_games())
+                    elif isinstance(message, dict) and 'replay' in message:
+                        self.stream_game_replay(con, message)
+                    elif isinstance(message, dict):
+                        self.send(con, self.get_replay_page(message))
                     else:
                         selection = message
                 else:
-                    with open(f'replay/{selection}.pkl', 'rb') as file:
-                        send_data = pickle.load(file)
-                    self.send(con, send_data)
+                    self.send(con, self.load_game_replay(selection))
                     selection = Message.NO_SELECTION
             except Exception as er:
                 self.logger.error(str(er))
@@ -250,58 +510,131 @@ class Server:
         self.logger.info(f'Replay {replay_id} disconnected')
         con.close()
 
-    # return all played games
-    @staticmethod
-    def get_all_games():
-        all_games = [file_name[:-4] for file_name in utility.get_all_file_names('replay')]
-        return all_games
+    def load_game_replay(self, replay_name: str):
+        return self.replay_store.load(replay_name)
+
+    # request keys: replay (name), start and end ply (optional, end excluded)
+    # the header goes first with the range that follows, then the moves in chunks
+    def get_replay_header(self, request: dict):
+        header = self.replay_store.read_header(request['replay'])
+        header['name'] = request['replay']
+        header['start'] = max(0, min(int(request.get('start', 0)), header['plies']))
+        header['end'] = max(header['start'], min(int(request.get('end', header['plies'])), header['plies']))
+        return header
+
+    def get_replay_chunk(self, replay_name: str, start: int, end: int):
+        return protocol.encode_replay_chunk(start, self.replay_store.read_moves(replay_name, start, end))
+
+    def stream_game_replay(self, con: Connection, request: dict):
+        header = self.get_replay_header(request)
+        self.send(con, header)
+        for start in range(header['start'], header['end'], REPLAY_CHUNK_PLIES):
+            end = min(header['end'], start + REPLAY_CHUNK_PLIES)
+            if not self.send_payload(con, self.get_replay_chunk(header['name'], start, end)):
+                break
+
+    # return the newest page of played games
+    def get_all_games(self):
+        return self.replay_catalogue.query()
+
+    # one page of played games, query keys: page, page_size, start, end (epoch seconds), player,
+    # before ((timestamp, name) of the first game of the listing)
+    def get_replay_page(self, query: dict):
+        return self.replay_catalogue.query(
+            page=int(query.get('page', 0)),
+            page_size=int(query.get('page_size', replay_catalogue.PAGE_SIZE)),
+            start=query.get('start'),
+            end=query.get('end'),
+            player=query.get('player'),
+            before=query.get('before')
+        )
+
+    # register a new play client and put it in the matchmaking queue
+    def add_player(self, con):
+        client_id = self.num_players
+        self.send(con, client_id)
+
+        self.connecting_players[client_id] = {'connection': con, 'game_id': None}
+        self.player_queue.append(client_id)
+
+        self.logger.info(f'Player {client_id} connected')
+        self.num_players += 1
+        return client_id
+
+    def add_viewer(self, con):
+        client_id = self.num_viewers
+        self.send(con, client_id)
+
+        self.logger.info(f'Viewer {client_id} connected')
+        self.num_viewers += 1
+        return client_id
+
+    def add_replay(self, con):
+        client_id = self.num_replays
+        self.send(con, client_id)
+
+        self.logger.info(f'Replay {client_id} connected')
+        self.num_replays += 1
+        return client_id
 
     def start(self):
         self.server_socket.listen()
         self.logger.info("Waiting for connection, server started")
         player_queue_handler_thread = threading.Thread(target=self.player_queue_handle, daemon=True)
         player_queue_handler_thread.start()
+        self.clock_scheduler.start()
 
         while True:
             con, addr = self.server_socket.accept()
+            con = QueuedConnection(con, self.header_length)
             action = self.receive(con)
 
             # for play client
             if action == Message.PLAY:
-                client_id = self.num_players
-                self.send(con, client_id)
-
-                self.connecting_players[client_id] = {'connection': con, 'game_id': None}
+                client_id = self.add_player(con)
                 thread = threading.Thread(target=self.client_play, args=(con, client_id))
                 thread.start()
-                self.player_queue.append(client_id)
-
-                self.logger.info(f'Player {client_id} connected')
-                self.num_players += 1
 
             # for view client
             elif action == Message.VIEW:
-                client_id = self.num_viewers
-                self.send(con, client_id)
-
+                client_id = self.add_viewer(con)
                 thread = threading.Thread(target=self.client_view, args=(con, client_id))
                 thread.start()
 
-                self.logger.info(f'Viewer {client_id} connected')
-                self.num_viewers += 1
-
             # for replay client
             else:
-                client_id = self.num_replays
-                self.send(con, client_id)
-
+                client_id = self.add_replay(con)
                 thread = threading.Thread(target=self.client_replay, args=(con, client_id))
                 thread.start()
 
-                self.logger.info(f'Replay {client_id} connected')
-                self.num_replays += 1
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Chess.io server')
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='serve every client on a single asyncio event loop instead of one thread per client')
+    parser.add_argument('--increment', type=float, default=0,
+                        help='Fischer increment, seconds added to the clock of a player after each move')
+    parser.add_argument('--delay', type=float, default=0,
+                        help='Bronstein delay, up to this many seconds of each move are given back')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='play the games in this many worker processes behind one supervisor process')
+    return parser.parse_args()
+
+
+def time_control(args):
+    return scheduler.DEFAULT_TIME_CONTROL._replace(increment=args.increment, delay=args.delay)
 
 
 if __name__ == '__main__':
-    server = Server()
+    args = parse_args()
+    if args.workers:
+        from cluster import Supervisor
+        server = Supervisor(args.ip, args.port, time_control(args), args.workers)
+    elif args.use_async:
+        from async_server import AsyncServer
+        server = AsyncServer(args.ip, args.port, time_control(args))
+    else:
+        server = Server(args.ip, args.port, time_control(args))
     server.start()
@@ -0,0 +1,52 @@
+import pickle
+import threading
+
+
+# pickled game data per game, reused until the game is marked as changed
+class SnapshotCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.versions = {}
+        self.entries = {}
+        # ---------------------------------------
+        self.hits = 0
+        self.misses = 0
+
+    # call whenever the board, clocks, viewers or state of the game change
+    def invalidate(self, game_id: int):
+        with self.lock:
+            self.versions[game_id] = self.versions.get(game_id, 0) + 1
+
+    def version(self, game_id: int):
+        return self.versions.get(game_id, 0)
+
+    def get(self, game_id: int, game: dict):
+        with self.lock:
+            version = self.versions.get(game_id, 0)
+            entry = self.entries.get(game_id)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        payload = pickle.dumps(game)
+        with self.lock:
+            # only keep it if nothing changed while pickling
+            if self.versions.get(game_id, 0) == version:
+                self.entries[game_id] = (version, payload)
+        return payload
+
+    def remove(self, game_id: int):
+        with self.lock:
+            self.versions.pop(game_id, None)
+            self.entries.pop(game_id, None)
+
+    def metrics(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'cached_games': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0
+            }
@@ -1,6 +1,6 @@
 import logging
 import colorlog
-import pygame
+import chess
 import glob
 import os
 
@@ -10,55 +10,30 @@ def get_all_file_names(folder_path: str):
     return [os.path.basename(file_path) for file_path in file_paths]
 
 
-# load in game piece images (queen, king, rook, bishop, knight, pawn) x 2
-def get_image_resources():
-    small_piece_size = 30
-    piece_size = 50
-
-    black_queen = pygame.image.load('img/black-queen.png')
-    black_queen_small = pygame.transform.scale(black_queen, (small_piece_size, small_piece_size))
-    black_king = pygame.image.load('img/black-king.png')
-    black_king_small = pygame.transform.scale(black_king, (small_piece_size, small_piece_size))
-    black_rook = pygame.image.load('img/black-rook.png')
-    black_rook_small = pygame.transform.scale(black_rook, (small_piece_size, small_piece_size))
-    black_bishop = pygame.image.load('img/black-bishop.png')
-    black_bishop_small = pygame.transform.scale(black_bishop, (small_piece_size, small_piece_size))
-    black_knight = pygame.image.load('img/black-knight.png')
-    black_knight_small = pygame.transform.scale(black_knight, (small_piece_size, small_piece_size))
-    black_pawn = pygame.image.load('img/black-pawn.png')
-    black_pawn_small = pygame.transform.scale(black_pawn, (small_piece_size, small_piece_size))
-
-    white_queen = pygame.image.load('img/white-queen.png')
-    white_queen_small = pygame.transform.scale(white_queen, (small_piece_size, small_piece_size))
-    white_king = pygame.image.load('img/white-king.png')
-    white_king_small = pygame.transform.scale(white_king, (small_piece_size, small_piece_size))
-    white_rook = pygame.image.load('img/white-rook.png')
-    white_rook_small = pygame.transform.scale(white_rook, (small_piece_size, small_piece_size))
-    white_bishop = pygame.image.load('img/white-bishop.png')
-    white_bishop_small = pygame.transform.scale(white_bishop, (small_piece_size, small_piece_size))
-    white_knight = pygame.image.load('img/white-knight.png')
-    white_knight_small = pygame.transform.scale(white_knight, (small_piece_size, small_piece_size))
-    white_pawn = pygame.image.load('img/white-pawn.png')
-    white_pawn_small = pygame.transform.scale(white_pawn, (small_piece_size, small_piece_size))
-
-    piece_images = [white_pawn, white_queen, white_king, white_knight, white_rook, white_bishop,
-                    black_pawn, black_queen, black_king, black_knight, black_rook, black_bishop]
-    small_piece_images = [white_pawn_small, white_queen_small, white_king_small,
-                          white_knight_small, white_rook_small, white_bishop_small,
-                          black_pawn_small, black_queen_small, black_king_small,
-                          black_knight_small, black_rook_small, black_bishop_small]
-    piece_list = ['P', 'Q', 'K', 'N', 'R', 'B',
-                  'p', 'q', 'k', 'n', 'r', 'b']
-
-    result = {
-        'piece_size': piece_size,
-        'pawn_size': 50,
-        'small_piece_size': small_piece_size,
-        'piece_images': piece_images,
-        'small_piece_images': small_piece_images,
-        'piece': piece_list
-    }
-    return result
+# push a move and record (time to move in ms, captured piece) for the replay and captured piece column
+def push_move(board: chess.Board, moves_information: list, move: chess.Move, time_to_move: int, captures=None):
+    captured_piece = None
+    if board.is_en_passant(move):
+        captured_piece = chess.Piece(chess.PAWN, not board.turn)
+    elif board.is_capture(move):
+        captured_piece = board.piece_at(move.to_square)
+    if captures is not None:
+        captures.push(move, captured_piece, board.turn)
+    board.push(move)
+    moves_information.append((time_to_move, captured_piece))
+
+
+# resident and peak memory of a process in KB, None where /proc is not available
+def memory_usage(pid='self'):
+    status = {}
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                key, value = line.split(':', 1)
+                status[key] = value.strip()
+    except OSError:
+        return None, None
+    return int(status['VmRSS'].split()[0]), int(status['VmHWM'].split()[0])
 
 
 def get_logger():
@@ -104,6 +79,7 @@ class Message:
     ALL_DATA = 'ALL DATA'
     VIEWING = 'VIEWING'
     STOP_VIEWING = 'STOP_VIEWING'
+    METRICS = 'METRICS'
 
 
 if __name__ == '__main__':